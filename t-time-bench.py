@@ -0,0 +1,224 @@
+#! /usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""t-time-bench
+author: Andrew Bailey
+Time how long t-time takes to process synthetic GTFS feeds, to catch it getting slower
+
+function exports:
+generateFeed
+runPhases
+benchmarkFeed
+benchmarkQueries
+compareResults
+main
+
+variable exports:
+_presets
+_phases
+_noiseSeconds
+"""
+
+import argparse,datetime,importlib,json,os,platform,random,subprocess,sys,tempfile,time,zipfile
+from sys import argv,exit
+
+# feed sizes to benchmark: routes, trips per route, stops per trip, service IDs, days of service
+_presets={
+    "small":{"routes":5,"trips":40,"stops":20,"services":3,"days":120},
+    "medium":{"routes":40,"trips":200,"stops":25,"services":6,"days":180},
+    "large":{"routes":150,"trips":600,"stops":40,"services":12,"days":365},
+}
+# GtfsProcessor methods timed, in the order they run
+_phases=("readRoutes","readTrips","readStops","readSchedules","buildDataModel","formatOutputVars","writeHtml")
+# phases that got slower by less than this many seconds are not regressions, since short phases vary a lot
+_noiseSeconds=0.01
+
+def generateFeed(filename,routes=5,trips=40,stops=20,services=3,days=120,startDate=datetime.date(2026,9,1),seed=1):
+    """write a GTFS zip with the given number of routes, trips per route, stops per trip, service IDs, and days of service. the same arguments always make the same feed. return number of rows in stop_times.txt."""
+    rand=random.Random(seed)
+    weekdays=((1,1,1,1,1,0,0),(0,0,0,0,0,1,0),(0,0,0,0,0,0,1))
+    with zipfile.ZipFile(filename,"w",zipfile.ZIP_DEFLATED) as feed:
+        feed.writestr("agency.txt","agency_id,agency_name,agency_url,agency_timezone\nBENCH,Benchmark Transit,http://localhost/,America/New_York\n")
+        rows=["route_id,agency_id,route_short_name,route_long_name,route_type"]
+        for route in range(routes):
+            rows.append("R{0},BENCH,{1},\"Route {1}, Downtown\",3".format(route,route+1))
+        feed.writestr("routes.txt","\n".join(rows)+"\n")
+        rows=["stop_id,stop_name,stop_lat,stop_lon"]
+        for stop in range(routes*stops):
+            rows.append("S{0},{1},0,0".format(stop,"Stop {0} Station".format(stop) if 0==stop%7 else "Stop {0}".format(stop)))
+        feed.writestr("stops.txt","\n".join(rows)+"\n")
+        tripRows=["route_id,service_id,trip_id,trip_headsign,direction_id"]
+        stopRows=[]
+        tripId=0
+        for route in range(routes):
+            for trip in range(trips):
+                direction=trip%2
+                tripRows.append("R{0},SV{1},T{2},{3},{4}".format(route,rand.randrange(services),tripId,("Inbound","Outbound")[direction],direction))
+                seconds=rand.randrange(5*3600,26*3600) # some trips run past midnight
+                sequence=range(stops-1,-1,-1) if direction else range(stops)
+                for order,stop in enumerate(sequence):
+                    if 0<order and rand.random()<0.1:
+                        continue
+                    seconds+=rand.randrange(60,300)
+                    stoptime="{0:02d}:{1:02d}:{2:02d}".format(seconds//3600,seconds%3600//60,seconds%60)
+                    stopRows.append("T{0},{1},{1},S{2},{3},{4},0".format(tripId,stoptime,route*stops+stop,order*2+1,"1" if rand.random()<0.05 else "0"))
+                tripId+=1
+        # stop_times.txt is rarely sorted by trip
+        rand.shuffle(stopRows)
+        feed.writestr("trips.txt","\n".join(tripRows)+"\n")
+        feed.writestr("stop_times.txt","trip_id,arrival_time,departure_time,stop_id,stop_sequence,pickup_type,drop_off_type\n"+"\n".join(stopRows)+"\n")
+        rows=["service_id,monday,tuesday,wednesday,thursday,friday,saturday,sunday,start_date,end_date"]
+        for service in range(services):
+            start=startDate+datetime.timedelta(days=rand.randrange(30))
+            end=start+datetime.timedelta(days=days)
+            rows.append("SV{0},{1},{2},{3}".format(service,",".join(str(day) for day in weekdays[service%3]),start.strftime("%Y%m%d"),end.strftime("%Y%m%d")))
+        feed.writestr("calendar.txt","\n".join(rows)+"\n")
+        rows=["service_id,date,exception_type"]
+        for service in range(services):
+            date=startDate+datetime.timedelta(days=rand.randrange(days))
+            rows.append("SV{0},{1},{2}".format(service,date.strftime("%Y%m%d"),rand.choice((1,2))))
+        feed.writestr("calendar_dates.txt","\n".join(rows)+"\n")
+    return len(stopRows)
+def runPhases(feedFilename,outputName,parallelStops=True):
+    """process a feed once with t-time (without its cache), and return dictionary of phase names to seconds taken. route data is made as it is written, so most of it is timed in writeHtml."""
+    t_time=importlib.import_module("t-time")
+    here=os.path.dirname(os.path.abspath(__file__))
+    gtfs=t_time.GtfsProcessor()
+    gtfs.parallelStops=parallelStops
+    gtfs.useCache=False
+    times={}
+    with zipfile.ZipFile(feedFilename) as inputZip:
+        gtfs.readAgencyName(inputZip)
+        gtfs.outputName=outputName
+        for phase in _phases:
+            start=time.perf_counter()
+            if "writeHtml"==phase:
+                # reading CSS and the template are part of writing
+                gtfs.readCss(os.path.join(here,"t-time.css"))
+                gtfs.readHtmlTemplate(os.path.join(here,"t-time.html"))
+                gtfs.writeHtml()
+            elif phase.startswith("read"):
+                getattr(gtfs,phase)(inputZip)
+            else:
+                getattr(gtfs,phase)()
+            times[phase]=time.perf_counter()-start
+    return times
+def benchmarkFeed(feedFilename,outputName,repeat=1,parallelStops=True):
+    """benchmark a feed in a new process each time (so memory use is its own), return dictionary of fastest time for each phase, total of those, peak memory, and output size"""
+    results=None
+    for attempt in range(repeat):
+        command=[sys.executable,os.path.abspath(__file__),"--single",feedFilename,outputName]
+        if not parallelStops:
+            command.append("--serial")
+        single=json.loads(subprocess.run(command,check=True,stdout=subprocess.PIPE).stdout.decode("utf-8").splitlines()[-1])
+        if results is None:
+            results=single
+        else:
+            results["phases"]={phase:min(seconds,single["phases"][phase]) for phase,seconds in results["phases"].items()}
+            if results["peakMemory"] is not None:
+                results["peakMemory"]=max(results["peakMemory"],single["peakMemory"])
+    results["total"]=sum(results["phases"].values())
+    results["outputBytes"]=os.path.getsize(outputName)
+    return results
+def benchmarkQueries(feedFilename,queries=2000,seed=1):
+    """load a feed's DepartureIndex (without t-time's cache), and time random next-departure queries of a route at one of its stops. return dictionary of seconds to load, number of queries, seconds per query, queries per second, and seconds of the slowest query."""
+    t_time=importlib.import_module("t-time")
+    start=time.perf_counter()
+    index=t_time.loadDepartureIndex(feedFilename,useCache=False)
+    load=time.perf_counter()-start
+    rand=random.Random(seed)
+    stops=sorted(index.departures)
+    asked=[]
+    for query in range(queries):
+        routeId,stopId=rand.choice(stops)
+        asked.append((stopId,routeId,datetime.datetime(2026,9,1)+datetime.timedelta(minutes=rand.randrange(400*24*60))))
+    slowest=0.0
+    start=time.perf_counter()
+    for stopId,routeId,when in asked:
+        queryStart=time.perf_counter()
+        index.nextDepartures(stopId,routeId,when)
+        slowest=max(slowest,time.perf_counter()-queryStart)
+    seconds=time.perf_counter()-start
+    return {"load":load,"queries":queries,"query":seconds/queries,"perSecond":queries/seconds,"slowest":slowest}
+def compareResults(old,new,threshold):
+    """compare benchmark results (as from main) by feed name and phase (and seconds per query, if both have them). return list of (feed, phase, old seconds, new seconds) that are more than threshold (like 0.1 for 10%) and _noiseSeconds slower."""
+    slower=[]
+    oldFeeds={result["name"]:result for result in old["results"]}
+    for result in new["results"]:
+        if result["name"] not in oldFeeds:
+            continue
+        oldPhases=dict(oldFeeds[result["name"]]["phases"],total=oldFeeds[result["name"]]["total"])
+        phases=dict(result["phases"],total=result["total"])
+        if "queries" in result and "queries" in oldFeeds[result["name"]]:
+            # queries are too quick for _noiseSeconds, so they are compared as time for a million of them
+            oldPhases["query"]=oldFeeds[result["name"]]["queries"]["query"]*1000000
+            phases["query"]=result["queries"]["query"]*1000000
+        for phase,seconds in phases.items():
+            if phase in oldPhases and seconds>oldPhases[phase]*(1+threshold) and seconds-oldPhases[phase]>_noiseSeconds:
+                slower.append((result["name"],phase,oldPhases[phase],seconds))
+    return slower
+
+def main(args):
+    """command line entry point. args are like argv, without the program name"""
+    parser=argparse.ArgumentParser(prog="t-time-bench.py",description="Benchmark t-time on synthetic GTFS feeds, and write results as JSON.")
+    parser.add_argument("presets",nargs="*",default=["small","medium"],help="feed sizes to run: {0} or custom (default: small medium)".format(", ".join(_presets)))
+    parser.add_argument("--routes",type=int,help="custom feed: number of routes")
+    parser.add_argument("--trips",type=int,help="custom feed: trips per route")
+    parser.add_argument("--stops",type=int,help="custom feed: stops per trip")
+    parser.add_argument("--services",type=int,help="custom feed: number of service IDs")
+    parser.add_argument("--days",type=int,help="custom feed: days of service")
+    parser.add_argument("--seed",type=int,default=1,help="random seed for feeds (default: 1)")
+    parser.add_argument("--repeat",type=int,default=3,help="runs per feed, the fastest time of each phase is kept (default: 3)")
+    parser.add_argument("--serial",action="store_true",help="don't use a process pool to read stop_times.txt")
+    parser.add_argument("--queries",type=int,default=2000,help="next-departure queries to time on each feed, 0 to skip them (default: 2000)")
+    parser.add_argument("--feed-dir",help="keep generated feeds and outputs here (default: a temporary directory)")
+    parser.add_argument("--output",default="t-time-bench.json",help="results file (default: t-time-bench.json)")
+    parser.add_argument("--compare",help="results file of an earlier run, to report phases that got slower")
+    parser.add_argument("--threshold",type=float,default=0.1,help="how much slower is a regression with --compare (default: 0.1, for 10%%)")
+    parser.add_argument("--single",nargs=2,metavar=("FEED","OUTPUT"),help=argparse.SUPPRESS)
+    options=parser.parse_args(args)
+    if options.single is not None:
+        phases=runPhases(*options.single,parallelStops=not options.serial)
+        print(json.dumps({"phases":phases,"peakMemory":importlib.import_module("t-time").peakMemory()}))
+        return
+    custom={size:getattr(options,size) for size in _presets["small"] if getattr(options,size) is not None}
+    feeds=[]
+    for preset in options.presets:
+        if "custom"==preset:
+            feeds.append(("custom",dict(_presets["small"],**custom)))
+        elif preset in _presets:
+            feeds.append((preset,_presets[preset]))
+        else:
+            parser.error("unknown feed size {0}".format(preset))
+    report={"date":datetime.datetime.now().isoformat(timespec="seconds"),"python":platform.python_version(),"platform":platform.platform(),"cpus":os.cpu_count(),"parallelStops":not options.serial,"repeat":options.repeat,"results":[]}
+    with tempfile.TemporaryDirectory() as tempDir:
+        feedDir=tempDir if options.feed_dir is None else options.feed_dir
+        os.makedirs(feedDir,exist_ok=True)
+        for name,sizes in feeds:
+            feedFilename=os.path.join(feedDir,"{0}.zip".format(name))
+            stopTimes=generateFeed(feedFilename,seed=options.seed,**sizes)
+            result=benchmarkFeed(feedFilename,os.path.join(feedDir,"{0}.html".format(name)),options.repeat,not options.serial)
+            if 0<options.queries:
+                result["queries"]=benchmarkQueries(feedFilename,options.queries,options.seed)
+            report["results"].append(dict(name=name,feed=dict(sizes,seed=options.seed,stopTimes=stopTimes,feedBytes=os.path.getsize(feedFilename)),**result))
+            print("{0}: {1:.3f}s total, {2}".format(name,result["total"],", ".join("{0} {1:.3f}s".format(phase,seconds) for phase,seconds in result["phases"].items())))
+            if result["peakMemory"] is not None:
+                print("{0}: peak memory {1:.1f} MB, output {2:.1f} KB".format(name,result["peakMemory"]/1048576,result["outputBytes"]/1024))
+            if "queries" in result:
+                print("{0}: {1:.0f} queries per second ({2:.1f} µs each, slowest {3:.1f} µs) after loading in {4:.3f}s".format(name,result["queries"]["perSecond"],result["queries"]["query"]*1000000,result["queries"]["slowest"]*1000000,result["queries"]["load"]))
+    with open(options.output,"w",encoding="utf-8") as output:
+        json.dump(report,output,indent=1)
+    print("Wrote {0}".format(options.output))
+    if options.compare is not None:
+        with open(options.compare,"r",encoding="utf-8") as old:
+            slower=compareResults(json.load(old),report,options.threshold)
+        for name,phase,oldSeconds,newSeconds in slower:
+            if "query"==phase:
+                print("{0} queries are slower: {1:.1f} µs, was {2:.1f} µs".format(name,newSeconds,oldSeconds))
+            else:
+                print("{0} {1} is slower: {2:.3f}s, was {3:.3f}s".format(name,phase,newSeconds,oldSeconds))
+        if slower:
+            exit(1)
+
+if "__main__"==__name__:
+    main(argv[1:])
@@ -15,12 +15,15 @@ MultiSelecter
 variable exports:
 _baseTitle
 _padding
+_progressInterval
 """
 
 # title of window
 _baseTitle="t-time"
 # how much spacing around widgets
 _padding=6
+# how often (in milliseconds) to check on work in the background
+_progressInterval=100
 
 class GtfsProcessorGui(tkinter.Tk):
     """subclasses tkinter.Tk for main window"""
@@ -61,26 +64,70 @@ class RouteSelecter(tkinter.ttk.Frame):
         self.selectRoutes.pack(fill=tkinter.BOTH,expand=True,padx=_padding,pady=_padding)
         self.pack(side=tkinter.TOP)
     def next(self):
-        self.pbar=tkinter.ttk.Progressbar(self.master,orient="horizontal",mode="indeterminate")
+        """read the feed for selected routes in the background, showing progress"""
+        self.master.gtfs.selectedRoutes=self.selectRoutes.getSelected()
+        self.master.bNext.configure(state=tkinter.DISABLED)
+        self.pbar=tkinter.ttk.Progressbar(self.master,orient="horizontal",mode="determinate",maximum=1.0)
         self.pbar.pack(anchor=tkinter.E,side=tkinter.BOTTOM,fill=tkinter.X,expand=True,padx=_padding,pady=_padding)
+        self.plabel=tkinter.ttk.Label(self.master,text="Reading feed")
+        self.plabel.pack(anchor=tkinter.W,side=tkinter.BOTTOM,padx=_padding)
+        self.bCancel=tkinter.ttk.Button(self.master.buttonrow,text="Cancel",command=self.cancel,width=self.master._buttonWidth)
+        self.bCancel.pack(anchor=tkinter.S,side=tkinter.RIGHT,padx=_padding,pady=_padding)
         self.pack(side=tkinter.TOP)
-        self.pbar.start()
+        self.progress=None
+        self.cancelled=False
+        self.result=None
         threading.Thread(None,self.finishLogic).start()
-    def finishLogic(self):
-        """finish logic based on selected routes, and passes control to StopSelecter"""
-        self.master.gtfs.selectedRoutes=self.selectRoutes.getSelected()
-        self.master.gtfs.routes={}
-        self.master.gtfs.readRoutes(inputZip)
-        self.master.gtfs.readTrips(inputZip)
-        self.master.gtfs.readStops(inputZip)
-        self.master.gtfs.readSchedules(inputZip)
-        self.exclude,self.master.gtfs.excludeStops=self.master.gtfs.excludeStops,{}
-        self.master.gtfs.buildDataModel()
-        self.master.gtfs.excludeStops=self.exclude
-        self.pbar.stop()
+        self.after(_progressInterval,self.checkProgress)
+    def cancel(self):
+        """stop reading the feed (at the next progress update)"""
+        self.cancelled=True
+        self.bCancel.configure(state=tkinter.DISABLED)
+    def onProgress(self,filename,done,total):
+        """GtfsProcessor.progress, called in background threads (files are read at the same time)"""
+        if self.cancelled:
+            raise t_time.ProcessingCancelled()
+        self.progress=(filename,done,total)
+    def checkProgress(self):
+        """show progress of the background thread, and go on when it's done (tk is only used in its own thread)"""
+        if self.progress is not None:
+            filename,done,total=self.progress
+            self.pbar.configure(value=done/total if total else 0)
+            self.plabel.configure(text="Reading {0}".format(filename))
+        if self.result is None:
+            self.after(_progressInterval,self.checkProgress)
+            return
         self.pbar.destroy()
-        self.destroy()
-        self.master.mainframe=StopSelecter(self.master)
+        self.plabel.destroy()
+        self.bCancel.destroy()
+        self.master.bNext.configure(state=tkinter.NORMAL)
+        if "done"==self.result:
+            self.destroy()
+            self.master.mainframe=StopSelecter(self.master)
+        elif "failed"==self.result:
+            tkinter.messagebox.showerror(_baseTitle,"There was a problem reading the feed. See the console for details.",parent=self.master)
+    def finishLogic(self):
+        """read the feed (once) for selected routes, and keep it in master.model for StopSelecter"""
+        gtfs=self.master.gtfs
+        gtfs.progress=self.onProgress
+        try:
+            gtfs.routes={}
+            gtfs.schedules=set()
+            if not gtfs.loadCache(inputZip):
+                gtfs.readFeed(inputZip)
+            self.master.model=gtfs.getModel()
+            # show all stops, even ones excluded before
+            self.exclude,gtfs.excludeStops=gtfs.excludeStops,{}
+            gtfs.setModel(self.master.model)
+            gtfs.buildDataModel()
+            gtfs.excludeStops=self.exclude
+            self.result="done"
+        except t_time.ProcessingCancelled:
+            self.result="cancelled"
+        except (SystemExit,Exception):
+            self.result="failed"
+        finally:
+            gtfs.progress=None
 class StopSelecter(tkinter.ttk.Frame):
     """subclasses tkinter.Frame for stop selection"""
     def __init__(self,master):
@@ -109,25 +156,37 @@ class StopSelecter(tkinter.ttk.Frame):
         self.pack(side=tkinter.TOP)
     def next(self):
         """finish logic based on selected stops, writes HTML, and exits application"""
+        for routeName,selecter in self.stopSelecters.items():
+            selected=selecter.getSelected()
+            self.master.gtfs.excludeStops[routeName]=[stopid for stopid,stop in selecter.route.getAllStops().items() if stop.name not in selected]
+        self.master.bNext.configure(state=tkinter.DISABLED)
         self.pbar=tkinter.ttk.Progressbar(self.master,orient="horizontal",mode="indeterminate")
         self.pbar.pack(anchor=tkinter.E,side=tkinter.BOTTOM,fill=tkinter.X,expand=True,padx=_padding,pady=_padding)
         self.pack(side=tkinter.TOP)
         self.pbar.start()
+        self.outputName=None
         threading.Thread(None,self.finishLogic).start()
+        self.after(_progressInterval,self.checkProgress)
     def finishLogic(self):
-        for routeName,selecter in self.stopSelecters.items():
-            selected=selecter.getSelected()
-            excludeids=[]
-            for stopid,stop in selecter.route.getAllStops().items():
-                if stop.name not in selected:
-                    excludeids.append(stopid)
-            self.master.gtfs.excludeStops[routeName]=excludeids
-            selecter.route.reset()
-        self.master.gtfs.readTrips(inputZip)
-        self.master.gtfs.readStops(inputZip)
-        self.master.gtfs.buildDataModel()
+        """apply stop selections to the feed read by RouteSelecter (without reading it again), and write HTML"""
+        try:
+            self.master.gtfs.setModel(self.master.model)
+            self.master.gtfs.buildDataModel()
+            self.outputName=self.master.gtfs.completeOutput()
+        except (SystemExit,Exception):
+            self.outputName=False
+    def checkProgress(self):
+        """wait for the background thread, then say goodbye (or what went wrong)"""
+        if self.outputName is None:
+            self.after(_progressInterval,self.checkProgress)
+            return
         self.pbar.stop()
-        tkinter.messagebox.showinfo(_baseTitle,"Wrote {0} as final output. Have a nice trip!".format(self.master.gtfs.completeOutput()),parent=self.master)
+        if False is self.outputName:
+            self.pbar.destroy()
+            self.master.bNext.configure(state=tkinter.NORMAL)
+            tkinter.messagebox.showerror(_baseTitle,"There was a problem writing the output. See the console for details.",parent=self.master)
+            return
+        tkinter.messagebox.showinfo(_baseTitle,"Wrote {0} as final output. Have a nice trip!".format(self.outputName),parent=self.master)
         _root.destroy()
 class MultiSelecter(tkinter.ttk.LabelFrame):
     """create a labeled multiple select listbox with scrollbar"""
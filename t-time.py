@@ -10,34 +10,107 @@ Route
 Trip
 Stop
 SettingsFetcher
+RunReport
+ProcessingCancelled
 GtfsProcessor
+DepartureIndex
+FeedWatcher
+WatchRequestHandler
 
 function exports:
 parseDate
 formatDate
+servicesOn
 openCsv
 openFileInZip
+fileSize
+tempName
+peakMemory
+runTasks
+feedKey
+routeFingerprint
 formatTime
-removeSpaces
+timeSeconds
+toJson
+encodeOutput
+minifyCss
+minifyJs
+minifyTemplate
+writeTemplate
 handleException
 orderDistinctValues
+loadDepartureIndex
+runBatch
+main
 
 variable exports:
-_removeSpacesRegex
 _routeIdColumn
+_stopTimesChunkSize
+_cacheSuffix
+_cacheVersion
+_outputVersion
+_minifyVersion
+_moduleName
+_routeEncodings
+_noReport
+_timeSeconds
+_tripOrder
+_stopOrder
+_jsToken
+_jsRegularExpression
+_jsKeywordsBeforeExpressions
+_routeLabelHtml
+_routeSectionHtml
+_impliedTags
 """
 
-import csv,json,time,datetime,email.utils,re,zipfile,io,json,html.parser,codecs
+import csv,json,re,time,datetime,email.utils,zipfile,io,json,html.parser,itertools,errno,hashlib,pickle,argparse,sys,gzip,base64,contextlib,cProfile,os.path,http.server,threading,urllib.parse,functools,bisect
+from concurrent.futures import ThreadPoolExecutor
 from multiprocessing import Pool
 from string import Template
-from os import stat,cpu_count
-from collections import OrderedDict
-from sys import exit,argv
+from os import stat,cpu_count,replace,remove,times,scandir
+from collections import OrderedDict,deque
+from collections.abc import Iterable
+from operator import attrgetter
+from sys import exit,argv,intern
+try:
+    import resource
+except ImportError:
+    resource=None
 
 # routes will be referred to by this column from routes.txt
 _routeIdColumn="route_short_name"
-# see removeSpaces function
-_removeSpacesRegex=re.compile(r"([\'\"\]\}][,\:]) ([\'\"\[\{])",re.MULTILINE)
+# how many characters of stop_times.txt are given to a worker process at a time
+_stopTimesChunkSize=1<<22
+# appended to the zip filename to name its parsed feed cache
+_cacheSuffix=".t-time-cache"
+# change this when cached data would be different, so old caches are not used
+_cacheVersion=6
+# change this when the output of routes would be different, so routes from old outputs are not reused (see routeFingerprint)
+_outputVersion=4
+# change this when minifyTemplate would give something different, so old minified templates are not used (see GtfsProcessor.minifyTemplate)
+_minifyVersion=1
+# classes are pickled (see GtfsProcessor.getModel) under this module name, so pickles are the same whether this is run or imported
+_moduleName="t_time"
+# ways route data can be put in the output, so that it is only decoded when the route is shown (see encodeOutput)
+_routeEncodings=("json","gzip")
+# used instead of a RunReport phase when there isn't a report, so that timing costs nothing
+_noReport=contextlib.nullcontext()
+# GTFS times (like 25:10:00) to seconds, see timeSeconds
+_timeSeconds={}
+# sort keys: trips (in a schedule and direction) by time of their first stop, stops (in a trip) by sequence
+_tripOrder=attrgetter("time")
+_stopOrder=attrgetter("sequence")
+# markup for each route in the output, see GtfsProcessor.formatOutputVars
+_routeLabelHtml="\t<label for='radio-{1}'>{0}</label>\n"
+_routeSectionHtml="\t<input type='radio' name='line' value='{0}' id='radio-{0}'/>\n\t<section id='{0}'>\n\t\t<h1>{1}</h1>\n\t</section>\n"
+# JavaScript tokens for minifyJs: strings, template literals, comments, spaces, names and numbers, or any other character
+_jsToken=re.compile(r'"(?:\\.|[^"\\\n])*"|\'(?:\\.|[^\'\\\n])*\'|`(?:\\.|[^`\\])*`|//[^\n]*|/\*.*?\*/|\s+|[\w$]+|.',re.S)
+_jsRegularExpression=re.compile(r"/(?:\\.|\[(?:\\.|[^\]\\\n])*\]|[^/\\\n\[])+/[a-z]*")
+# after these, a slash starts a regular expression
+_jsKeywordsBeforeExpressions=("return","typeof","case","do","else","in","of","new","delete","void","throw","instanceof","yield","await")
+# elements that scripts make without naming them, so CSS for them is kept by minifyCss
+_impliedTags={"insertRow":("tr","tbody"),"insertCell":("td",),"createCaption":("caption",),"createTHead":("thead",),"tBodies":("tbody",),"createTBody":("tbody",)}
 
 def parseDate(datestr):
     """take the GTFS date format and return a date object"""
@@ -46,32 +119,179 @@ def parseDate(datestr):
 def formatDate(date):
     """take a date object and return a JS acceptable string"""
     return date.strftime("%Y-%m-%d")
+def servicesOn(calendar,date):
+    """return list of service IDs that run on a date, from a calendar like GtfsProcessor.calendar, or None if the calendar doesn't cover the date. this is how the output's getSchedules does it."""
+    datestr=formatDate(date)
+    weekday=1<<(date.isoweekday()%7)
+    services=[]
+    covered=False
+    for service in calendar["services"]:
+        if service[1]<=datestr<service[2]:
+            covered=True
+            if service[0] is not None and 0!=service[3]&weekday:
+                services.append(service[0])
+    for service,exceptionType in calendar["exceptions"].get(datestr,()):
+        if 1==exceptionType:
+            covered=True
+            if service is not None:
+                services.append(service)
+        elif service in services:
+            services.remove(service)
+    return services if covered else None
 def openCsv(fileobject):
-    """take a file object, determine format, and return a CSV DictReader"""
+    """take a file object (or string), determine format from the first block, and return a CSV reader that reads rows as they are needed"""
     if type(fileobject) is str:
         dialect=csv.Sniffer().sniff(fileobject[:4090])
         return csv.reader(io.StringIO(fileobject),dialect=dialect)
     else:
-        dialect=csv.Sniffer().sniff(fileobject.read(4090))
-        fileobject.seek(0)
-        return csv.reader(fileobject,dialect=dialect)
-def getFile(name,inputZip,shouldExitOnError=True):
+        dialect,start=_sniffStart(fileobject)
+        return csv.reader(itertools.chain(io.StringIO(start,newline=""),fileobject),dialect=dialect)
+def _sniffStart(fileobject):
+    """read the first block of a text file object to determine CSV format. return dialect and the text read, which ends at a line break"""
+    start=fileobject.read(4090)
+    dialect=csv.Sniffer().sniff(start)
+    return dialect,start+fileobject.readline()
+def openFileInZip(name,inputZip,shouldExitOnError=True):
+    """open a file from the GTFS zip (or current directory if inputZip is None) as text, which is decoded (and a BOM removed) as it is read"""
     try:
         if inputZip is None:
-            with open(name,encoding="utf-8") as fileObject:
-                return fileObject.read()
-        else:
-            with inputZip.open(name) as file:
-                fileBytes=file.read()
-                if fileBytes.startswith(codecs.BOM_UTF8):
-                    return fileBytes.decode("utf-8-sig")
-                return fileBytes.decode("utf-8")
+            return open(name,encoding="utf-8-sig",newline="")
+        try:
+            return io.TextIOWrapper(inputZip.open(name),encoding="utf-8-sig",newline="")
+        except KeyError:
+            raise FileNotFoundError(errno.ENOENT,"No such file in feed",name)
     except (FileNotFoundError,BaseException) as ex:
-        handleException(ex,shouldExit=shouldExitOnError)
+        return handleException(ex,shouldExit=shouldExitOnError)
+def fileSize(name,inputZip):
+    """return uncompressed size of a file from the GTFS zip (or current directory if inputZip is None)"""
+    if inputZip is None:
+        return stat(name).st_size
+    return inputZip.getinfo(name).file_size
+def tempName(filename):
+    """return a name to write filename to before replacing it, that other processes and threads writing it at the same time don't use"""
+    return "{0}.{1}-{2}.tmp".format(filename,os.getpid(),threading.get_ident())
+def peakMemory():
+    """return peak resident memory of this process in bytes, or None if it can't be found (like on Windows)"""
+    if resource is None:
+        return None
+    peak=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux gives kilobytes, macOS bytes
+    return peak if "darwin"==sys.platform else peak*1024
+def runTasks(tasks):
+    """run tasks in threads, each once the tasks it depends on have finished. tasks is a list of (name, function, names of tasks it depends on). return dictionary of task names to what their functions returned.
+
+    if tasks fail, the rest are finished first, and then the exception of the first task in the list that failed is raised, so that errors (and exit codes) are those of running them in that order.
+    """
+    futures={}
+    with ThreadPoolExecutor(max(1,len(tasks))) as executor:
+        while len(futures)<len(tasks):
+            ready=[task for task in tasks if task[0] not in futures and all(dependency in futures for dependency in task[2])]
+            if not ready:
+                raise ValueError("tasks depend on each other, or on tasks that aren't there")
+            for name,function,dependencies in ready:
+                futures[name]=executor.submit(_runTask,function,[futures[dependency] for dependency in dependencies])
+    return {task[0]:futures[task[0]].result() for task in tasks}
+def _runTask(function,dependencies):
+    for dependency in dependencies:
+        dependency.result()
+    return function()
+def _position(fileobject):
+    """return how many bytes of a text file object (of a file, or in a zip) have been read, or 0 if that can't be told"""
+    try:
+        return fileobject.buffer.tell()
+    except (AttributeError,OSError,ValueError):
+        return 0
+def _readChunks(fileobject,size,start=""):
+    """yield pieces of about size characters from a text file object that end at line breaks, the first one beginning with start"""
+    chunk=start+fileobject.read(size)
+    while chunk:
+        yield chunk+fileobject.readline()
+        chunk=fileobject.read(size)
+def _imapBounded(pool,func,iterable,limit):
+    """like Pool.imap, but only take items from iterable when fewer than limit are waiting for results, so they are not all held in memory"""
+    pending=deque()
+    for item in iterable:
+        pending.append(pool.apply_async(func,(item,)))
+        if len(pending)>=limit:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+def _dialectParams(dialect):
+    """turn a (sniffed, unpicklable) CSV dialect into keyword arguments for csv.reader"""
+    return {param:getattr(dialect,param) for param in ("delimiter","doublequote","escapechar","lineterminator","quotechar","quoting","skipinitialspace")}
+def _stopTimesColumns(headers):
+    """return indexes of the stop_times.txt columns used by _filterStopTimes"""
+    return (headers.index("trip_id"),headers.index("arrival_time"),headers.index("stop_sequence"),headers.index("stop_id"),headers.index("pickup_type"),headers.index("drop_off_type"))
+def _filterStopTimes(stoptimestxt,columns,trips):
+    """yield (trip ID, arrival time, stop sequence, stop ID) of stop_times.txt rows for the given trip IDs, where passengers can get on and off"""
+    tripIdColumn,stopTimeColumn,stopSequenceColumn,stopIdColumn,pickupColumn,dropoffColumn=columns
+    for stoprow in stoptimestxt:
+        if stoprow[tripIdColumn] in trips and "1"!=stoprow[pickupColumn] and "1"!=stoprow[dropoffColumn]:
+            yield (stoprow[tripIdColumn],stoprow[stopTimeColumn],stoprow[stopSequenceColumn],stoprow[stopIdColumn])
+def _initStopTimesWorker(trips,columns,dialect):
+    """set up a process for _readStopTimesChunk, so that these are only sent once per process"""
+    global _workerStopTimes
+    _workerStopTimes=(trips,columns,dialect)
+def _readStopTimesChunk(chunk):
+    """parse some lines of stop_times.txt in a worker process, return number of lines and list of _filterStopTimes output"""
+    trips,columns,dialect=_workerStopTimes
+    stoptimestxt=csv.reader(io.StringIO(chunk),**dialect)
+    stoptimes=list(_filterStopTimes(stoptimestxt,columns,trips))
+    return stoptimestxt.line_num,stoptimes
+def feedKey(inputZip):
+    """return a key that changes when any file in the GTFS zip does (by CRC and size), or when the cache format does"""
+    digest=hashlib.sha1(str(_cacheVersion).encode("utf-8"))
+    for info in sorted(inputZip.infolist(),key=lambda info:info.filename):
+        digest.update("{0}\0{1}\0{2}\n".format(info.filename,info.CRC,info.file_size).encode("utf-8"))
+    return digest.hexdigest()
+def _writeCacheKey(cache,key):
+    """start a cache file with its key (a hex digest) as plain bytes, so that a file that isn't the right cache is turned down before anything in it is unpickled"""
+    cache.write(key.encode("ascii")+b"\n")
+def _hasCacheKey(cache,key):
+    """does a cache file start with this key (see _writeCacheKey)?"""
+    expected=key.encode("ascii")+b"\n"
+    return cache.read(len(expected))==expected
+def _routeRecord(route):
+    """return (route ID, agency, short and long names, _routeIdColumn value), service IDs, and the pickled route, as kept by GtfsProcessor.getModel and saveCache"""
+    return (route.id,route.agency,route.shortname,route.longname,route.referredTo),tuple(route.schedules),pickle.dumps(route,pickle.HIGHEST_PROTOCOL)
+def _readCacheIndex(cache):
+    """return calendar, _routeIdColumn values of every route in the feed, and list of (route info, service IDs, offset, length) of routes, from the end of a cache file (see GtfsProcessor.saveCache)"""
+    cache.seek(-8,io.SEEK_END)
+    cache.seek(int.from_bytes(cache.read(8),"little"))
+    return pickle.load(cache)
+def routeFingerprint(pickledRoute,excludeStops,encoding=None,services=None):
+    """return a hash of everything in a route's output: its trips with their service IDs and directions, and their stops with times and names (as pickled before finalize, see GtfsProcessor.getModel), its excluded stops, how it is encoded, the services kept of it (by a date window, if there is one), and _outputVersion"""
+    digest=hashlib.sha1(pickledRoute)
+    digest.update(json.dumps([excludeStops,encoding,services,_outputVersion]).encode("utf-8"))
+    return digest.hexdigest()
+def _splitRouteFragments(data,fingerprints):
+    """find output of each route in the data of an old output, using the fingerprints (route IDs to [fingerprint, output length]) stored with its settings. return dictionary of route IDs to (fingerprint, output), which is empty if the data doesn't match."""
+    fragments={}
+    if not data.startswith('{"routes":{'):
+        return fragments
+    position=len('{"routes":{')
+    for routeId,(fingerprint,length) in fingerprints.items():
+        key=toJson(routeId)+":"
+        if not data.startswith(key,position):
+            return {}
+        position+=len(key)
+        fragments[routeId]=(fingerprint,data[position:position+length])
+        position+=length
+        if data[position:position+1] not in (",","}"):
+            return {}
+        position+=1
+    return fragments
 def formatTime(timestr):
     """remove leading zeros on hours"""
     parts=timestr.split(':')
     return str(int(parts[0]))+":"+parts[1]
+def timeSeconds(timestr):
+    """return seconds since the start of the service day of a GTFS time, which can be after 24:00:00. each time is only converted once."""
+    seconds=_timeSeconds.get(timestr)
+    if seconds is None:
+        hours,minutes,secs=timestr.split(":")
+        seconds=_timeSeconds[timestr]=int(hours)*3600+int(minutes)*60+int(secs)
+    return seconds
 def orderDistinctValues(dic):
     """return values of a dictionary (in iteration order), without duplicates"""
     output=[]
@@ -79,9 +299,144 @@ def orderDistinctValues(dic):
         if value not in output:
             output.append(value)
     return tuple(output)
-def removeSpaces(victim):
-    """remove spaces between brackets and commas, for smaller filesize"""
-    return _removeSpacesRegex.sub(r"\1\2",victim)
+def toJson(obj):
+    """return compact JSON, which is safe to put in a script element"""
+    return json.dumps(obj,ensure_ascii=False,separators=(",",":")).replace("<","\\u003c")
+def encodeOutput(text,encoding=None):
+    """return JSON text for the output as is (encoding is None), as a JSON string ("json"), or as a JSON string of the gzipped text in base64 ("gzip"). strings aren't parsed with the rest of the output, and are decoded by the page when needed."""
+    if encoding is None:
+        return text
+    if "gzip"==encoding:
+        text=base64.b64encode(gzip.compress(text.encode("utf-8"),mtime=0)).decode("ascii")
+    return toJson(text)
+def _splitCss(css):
+    """yield (prelude, block) of each rule in CSS, like ("main>label", "color: red;"). blocks of at-rules can have rules in them. strings (and comments) are not split."""
+    depth=0
+    start=0
+    prelude=None
+    for match in re.finditer(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|/\*.*?\*/|[{}]',css,re.S):
+        if "{"==match.group():
+            if 0==depth:
+                prelude=css[start:match.start()]
+                start=match.end()
+            depth+=1
+        elif "}"==match.group() and 0<depth:
+            depth-=1
+            if 0==depth:
+                yield prelude,css[start:match.start()]
+                start=match.end()
+def _usedSelector(selector,words):
+    """is every class, ID, and element in a CSS selector in words (or a class like countdown5 whose start, like countdown, is)? arguments of pseudo-classes and attribute selectors aren't checked."""
+    selector=re.sub(r"\([^()]*\)|\[[^\]]*\]","",selector)
+    names=re.findall(r"[.#]([\w-]+)",selector)+re.findall(r"(?:^|[\s>+~])([a-zA-Z][\w-]*)",selector)
+    return all(name in words or re.sub(r"-?\d+$","",name) in words for name in names)
+def minifyCss(css,usedText=None):
+    """remove comments and spaces from CSS. if usedText (HTML and scripts that use the CSS) is given, also remove selectors that name classes, IDs, or elements not in it, and rules that have no selectors left."""
+    words=None
+    if usedText is not None:
+        words=set(re.findall(r"[A-Za-z_][\w-]*",usedText))|{"html","head","body"}
+        for method,tags in _impliedTags.items():
+            if method in words:
+                words.update(tags)
+    output=[]
+    for prelude,block in _splitCss(css):
+        prelude=_minifyCssText(prelude)
+        if prelude.startswith("@"):
+            if "{" in block:
+                block=minifyCss(block,usedText)
+            else:
+                block=_minifyCssDeclarations(block)
+        else:
+            if words is not None:
+                prelude=",".join(selector for selector in _splitSelectors(prelude) if _usedSelector(selector,words))
+                if not prelude:
+                    continue
+            block=_minifyCssDeclarations(block)
+        output.append(prelude+"{"+block+"}")
+    return "".join(output)
+def _splitSelectors(prelude):
+    """split selectors at commas that aren't in brackets"""
+    selectors=[""]
+    depth=0
+    for part in re.split(r"([(),\[\]])",prelude):
+        if part in ("(","["):
+            depth+=1
+        elif part in (")","]"):
+            depth-=1
+        elif ","==part and 0==depth:
+            selectors.append("")
+            continue
+        selectors[-1]+=part
+    return selectors
+def _minifyCssText(text):
+    """remove comments and extra spaces (outside strings) from CSS text. spaces around combinators are removed, but not others (like descendant selectors, or between values)."""
+    pieces=re.split(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')',re.sub(r"/\*.*?\*/","",text,flags=re.S) if "/*" in text else text)
+    for index in range(0,len(pieces),2):
+        pieces[index]=re.sub(r"\s*([>{};,])\s*",r"\1",re.sub(r"\s+"," ",pieces[index]))
+    return "".join(pieces).strip()
+def _minifyCssDeclarations(block):
+    """minify a block of declarations, like "color: red; margin: 0;" to "color:red;margin:0" """
+    declarations=[declaration.strip() for declaration in re.findall(r'(?:"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|[^;"\'])+',_minifyCssText(block))]
+    return ";".join(re.sub(r"^([\w-]+)\s*:\s*",r"\1:",declaration) for declaration in declarations if declaration)
+def minifyJs(js):
+    """remove comments and indentation from JavaScript. line breaks are kept where a missing semicolon might need them, and strings and regular expressions are left alone."""
+    output=[]
+    position=0
+    last=""
+    pendingSpace=pendingBreak=False
+    while position<len(js):
+        match=_jsToken.match(js,position)
+        token=match.group()
+        if "/"==token and (""==last or last[-1] in "(,=:[!&|?{};+-*%<>~^" or last in _jsKeywordsBeforeExpressions):
+            # a regular expression, not division
+            match=_jsRegularExpression.match(js,position) or match
+            token=match.group()
+        position=match.end()
+        if token.isspace() or token.startswith("/*") or token.startswith("//"):
+            pendingBreak=pendingBreak or "\n" in token or token.startswith("//")
+            pendingSpace=True
+            continue
+        output.append(_jsSeparator(last,token,pendingSpace,pendingBreak))
+        output.append(token)
+        last=token
+        pendingSpace=pendingBreak=False
+    return "".join(output)
+def _jsSeparator(last,token,space,lineBreak):
+    """return what should be between two JavaScript tokens, that had spaces (or a line break) between them"""
+    if not last or not (space or lineBreak):
+        return ""
+    if lineBreak and last[-1] not in ";{,([" and token[0] not in ")]}":
+        return "\n"
+    if (re.match(r"[\w$]",last[-1]) and re.match(r"[\w$]",token[0])) or (last[-1]==token[0] and token[0] in "+-"):
+        return " "
+    return ""
+def minifyTemplate(template,css):
+    """minify scripts (without a type) in an HTML template with minifyJs, and CSS (like "<style>...</style>") with minifyCss, keeping only rules for what the template and route markup use. return template and CSS."""
+    usedText=template+_routeLabelHtml+_routeSectionHtml
+    template=re.sub(r"(<script>)(.*?)(</script>)",lambda match:match.group(1)+minifyJs(match.group(2))+match.group(3),template,flags=re.S)
+    if css is not None:
+        css=re.sub(r"(<style>)(.*?)(</style>)",lambda match:match.group(1)+minifyCss(match.group(2),usedText)+match.group(3),css,flags=re.S)
+    return template,css
+def writeTemplate(template,mapping,output):
+    """like string.Template.substitute, but write to output as it goes. values that are iterable (and not strings) are written piece by piece."""
+    text=template.template
+    position=0
+    for match in template.pattern.finditer(text):
+        output.write(text[position:match.start()])
+        position=match.end()
+        if match.group("escaped") is not None:
+            output.write(template.delimiter)
+            continue
+        name=match.group("named") or match.group("braced")
+        if name is None:
+            raise ValueError("Invalid placeholder in template: line {0}".format(text.count("\n",0,match.start())+1))
+        value=mapping[name]
+        if isinstance(value,str) or not isinstance(value,Iterable):
+            output.write(str(value))
+        else:
+            for piece in value:
+                output.write(piece)
+    output.write(text[position:])
 def handleException(ex,fileNotFound=None,base=None,shouldExit=True):
     """generic file exception handler"""
     if isinstance(ex,FileNotFoundError):
@@ -106,22 +461,70 @@ class Route:
         """drop current data (undo self.finalize)"""
         self.schedules={}
         self.stops={}
+        self.fragment=None # output to use instead of this, see GtfsProcessor.setModel
     def finalize(self,excludeStops):
         """organize all child trips and stops"""
-        stops=self.getAllStops()
+        if self.referredTo in excludeStops:
+            excludeStops={self.referredTo:frozenset(excludeStops[self.referredTo])}
         for sched in self.schedules.values():
             for destination in sched.values():
                 for trip in destination:
                     trip.finalize(excludeStops,self.referredTo)
+        # dictionaries are ordered sets of stop names here
+        stops={}
         for sched in self.schedules.values():
             for destination in sched.values():
                 for trip in destination:
                     for stop in trip.stops:
                         if stop.name is not None:
-                            if trip.direction not in self.stops:
-                                self.stops[trip.direction]=[]
-                            if stop.name not in self.stops[trip.direction]:
-                                self.stops[trip.direction].append(stop.name)
+                            if trip.direction not in stops:
+                                stops[trip.direction]={}
+                            stops[trip.direction][stop.name]=None
+        for direction,names in stops.items():
+            self.stops[direction]=list(names)
+    def getOutput(self,encoding=None):
+        """return this route as JSON for the output (after finalize, see encodeOutput), or its output from last time (see GtfsProcessor.setModel)"""
+        if self.fragment is not None:
+            return self.fragment
+        return encodeOutput(toJson(self.toJson()),encoding)
+    def toJson(self):
+        """return this route as an object for JSON output. stop names and times are in lists, and referred to by index. when times are not used often enough for that to be smaller, they are written in trips instead, and there is no list of them.
+
+        names -- list of stop names
+        stops -- dictionary of directions to lists of names (as indexes), which are columns for times in trips
+        times -- list of times (like 13:05)
+        schedules -- dictionary of service IDs to dictionaries of directions to lists of trips, which are lists of times (as indexes, or times if there is no list)
+        """
+        names={}
+        stops={}
+        for direction,stopnames in self.stops.items():
+            stops[direction]=[names.setdefault(name,len(names)) for name in stopnames]
+        times={}
+        timeIndexes={} # times from the feed (with seconds) to indexes
+        uses=[] # how many times each time is used
+        schedules={}
+        for service,directions in self.schedules.items():
+            schedules[service]={}
+            for direction,trips in directions.items():
+                schedules[service][direction]=tripTimes=[]
+                for trip in trips:
+                    tripTimes.append([])
+                    for stop in trip.stops:
+                        if stop.time not in timeIndexes:
+                            timeIndexes[stop.time]=times.setdefault(formatTime(stop.time),len(times))
+                            if len(uses)<len(times):
+                                uses.append(0)
+                        tripTimes[-1].append(timeIndexes[stop.time])
+                        uses[timeIndexes[stop.time]]+=1
+        times=list(times)
+        # each time in the list takes its quotes and a comma, and each use its index; written in trips, each use takes the time and its quotes
+        if sum(count*(len(time)+2) for time,count in zip(times,uses))<=sum(len(time)+3 for time in times)+sum(count*len(str(index)) for index,count in enumerate(uses)):
+            for directions in schedules.values():
+                for tripTimes in directions.values():
+                    for trip in tripTimes:
+                        trip[:]=[times[index] for index in trip]
+            return {"names":list(names),"stops":stops,"schedules":schedules}
+        return {"names":list(names),"stops":stops,"times":times,"schedules":schedules}
     def getAllTrips(self):
         """get all trips, regardless of schedule or direction"""
         trips={}
@@ -152,30 +555,28 @@ class Route:
     def __repr__(self):
         return self.__str__()
     def __str__(self):
-        return removeSpaces(str(
-            {#"id":self.id,
-             "stops":self.stops,
-             #"stopids":self.stopids,
-             "schedules":self.schedules}))
+        return toJson(self.toJson())
 class Trip:
     """a glorified list of stops"""
+    # there can be a lot of these, so keep them small
+    __slots__=("route","service","trip","direction","time","stops")
     def __init__(self, routeId, serviceId, tripId, tripDirection):
-        self.route=routeId
-        self.service=serviceId
+        self.route=intern(routeId)
+        self.service=intern(serviceId)
         self.trip=tripId
-        self.direction=tripDirection
+        self.direction=intern(tripDirection)
         self.time=None
         self.stops=[]
     def addStop(self, stop):
         self.stops.append(stop)
     def finalize(self,excludeStops,routename):
-        """exclude stops and determine time for trip as a whole, for sorting purposes"""
-        for stopobj in self.stops[:]:
-            if routename in excludeStops and stopobj.stopid in excludeStops[routename]:
-                self.stops.remove(stopobj)
-        self.stops.sort()
-        if self.stops[0]:
-            self.time=self.stops[0].time
+        """exclude stops and determine time for trip as a whole (in seconds, see timeSeconds), for sorting purposes"""
+        if routename in excludeStops:
+            exclude=excludeStops[routename]
+            self.stops=[stopobj for stopobj in self.stops if stopobj.stopid not in exclude]
+        self.stops.sort(key=_stopOrder)
+        # trips without stops go first, rather than not being comparable
+        self.time=timeSeconds(self.stops[0].time) if self.stops else -1
     def __lt__(self,other):
         if self.service!=other.service:
             return self.service.__lt__(other.service)
@@ -203,16 +604,15 @@ class Trip:
     def __repr__(self):
         return self.__str__()
     def __str__(self):
-        orderedstops=[]
-        for stop in self.stops:
-            orderedstops.append(formatTime(stop.time))
-        return str(orderedstops)
+        return toJson([formatTime(stop.time) for stop in self.stops])
 class Stop:
     """represents when a vehicle may pickup or dropoff passengers. a single specific instance will never exist in multiple schedules, routes, or trips."""
+    # there can be millions of these, so keep them small, and share equal strings between them
+    __slots__=("time","sequence","stopid","name")
     def __init__(self, arrivalTime, sequence, stopId, name=None):
-        self.time=arrivalTime
+        self.time=intern(arrivalTime)
         self.sequence=int(sequence)
-        self.stopid=stopId
+        self.stopid=intern(stopId)
         self.name=name
     def __lt__(self,other):
         return self.sequence<other.sequence
@@ -229,7 +629,7 @@ class Stop:
     def __repr__(self):
         return self.__str__()
     def __str__(self):
-        return str({
+        return toJson({
             "name":self.name,
             "time":self.time})
 class SettingsFetcher(html.parser.HTMLParser):
@@ -241,11 +641,15 @@ class SettingsFetcher(html.parser.HTMLParser):
         self.foundTag=False
         self.settings=None
         self.agencyName=None
+        self.data="" # JSON in the data script
     def handle_starttag(self,tag,attrs):
         """overides html.parser.HTMLParser.handle_starttag"""
         self.tag=tag
         if "script"==tag and len(attrs)==1 and "type"==attrs[0][0] and "application/x-t-time-settings"==attrs[0][1]:
             self.foundTag=True
+        elif "script"==tag and len(attrs)==1 and "type"==attrs[0][0] and "application/x-t-time-data"==attrs[0][1]:
+            self.tag="data"
+            self.foundTag=True
         elif "title"==tag:
             self.foundTag=True
     def handle_data(self,data):
@@ -253,11 +657,69 @@ class SettingsFetcher(html.parser.HTMLParser):
         if self.foundTag:
             if "script"==self.tag:
                 self.settings=data
+            elif "data"==self.tag:
+                self.data+=data
             elif "title"==self.tag:
                 self.agencyName=data
     def handle_endtag(self,tag):
         """overides html.parser.HTMLParser.handle_endtag"""
         self.foundTag=False
+class RunReport:
+    """measurements of a GtfsProcessor run, to find what is slow. see GtfsProcessor.report
+
+    phases -- dictionary of phase names (in order) to wall and CPU seconds (own and worker processes'), and peak memory after. phases run at the same time (see GtfsProcessor.readFeed) each count all CPU seconds of this process while they run.
+    files -- dictionary of feed filenames to rows scanned and kept, and details of how they were read
+    routes -- dictionary of routes (by _routeIdColumn) to numbers of trips and stops in the output
+    output -- dictionary of output sections to bytes written
+    """
+    def __init__(self):
+        self.phases={}
+        self.files={}
+        self.routes={}
+        self.output={}
+    @contextlib.contextmanager
+    def phase(self,name):
+        """time the code in a with statement as a phase. a phase that runs again is added to."""
+        startTimes=times()
+        start=time.perf_counter()
+        try:
+            yield
+        finally:
+            wall=time.perf_counter()-start
+            endTimes=times()
+            phase=self.phases.setdefault(name,{"wall":0.0,"cpu":0.0,"workerCpu":0.0})
+            phase["wall"]+=wall
+            phase["cpu"]+=endTimes.user+endTimes.system-startTimes.user-startTimes.system
+            phase["workerCpu"]+=endTimes.children_user+endTimes.children_system-startTimes.children_user-startTimes.children_system
+            phase["peakMemory"]=peakMemory()
+    def countRows(self,filename,scanned,kept,**details):
+        """record rows of a feed file read, and rows used"""
+        self.files[filename]=dict(details,scanned=scanned,kept=kept)
+    def countRoutes(self,routes):
+        """record trips and stops of routes (after GtfsProcessor.buildDataModel)"""
+        for route in routes.values():
+            trips=route.getAllTrips().values()
+            self.routes[route.referredTo]={"trips":len(trips),"stops":sum(len(trip.stops) for trip in trips),"reused":route.fragment is not None}
+    def countOutput(self,name,pieces):
+        """record bytes written for a section of output. pieces is a string, or something that yields strings (which is yielded from)."""
+        if isinstance(pieces,str):
+            self.output[name]=self.output.get(name,0)+len(pieces.encode("utf-8"))
+            return pieces
+        return self._countPieces(name,pieces)
+    def _countPieces(self,name,pieces):
+        for piece in pieces:
+            self.output[name]=self.output.get(name,0)+len(piece.encode("utf-8"))
+            yield piece
+    def toJson(self):
+        """return report as an object for JSON"""
+        phases={name:{key:round(value,6) if isinstance(value,float) else value for key,value in phase.items()} for name,phase in self.phases.items()}
+        return {"phases":phases,"files":self.files,"routes":self.routes,"output":self.output}
+    def write(self,filename):
+        """write report to a JSON file"""
+        with open(filename,"w",encoding="utf-8") as report:
+            json.dump(self.toJson(),report,indent=1)
+class ProcessingCancelled(Exception):
+    """raised by a GtfsProcessor.progress function to stop reading the feed"""
 class GtfsProcessor:
     """container to hold methods and variables necessary to process GTFS feeds"""
     def __init__(self,outputName=None,agencyName=None,_12hourClock=True):
@@ -267,21 +729,53 @@ class GtfsProcessor:
         self._12hourClock=_12hourClock # TODO: Automatically determine this based on current locale (python makes this unclear)
         self.selectedRoutes=() # tuple of route IDs
         self.excludeStops={} # dictionary of route IDs to lists of stop IDs
-        self.schedules=[]
+        self.schedules=set() # service IDs used by routes
         self.routes={}
+        self.parallelStops=True # parse stop_times.txt with a process pool, see readStops
+        self.useCache=True # keep parsed routes in a file next to the zip, see loadCache
+        self.feedRoutes=set() # _routeIdColumn values of every route in routes.txt, selected or not
+        self.incremental=False # reuse output of routes that didn't change since the last output, see setModel
+        self.oldRoutes={} # dictionary of route IDs to (fingerprint, output) from the last output
+        self.routeEncoding=None # one of _routeEncodings to have the page decode each route when it is shown, see encodeOutput
+        self.report=None # a RunReport to measure things with, if wanted
+        self.progress=None # called with (feed filename, bytes read, file size) while reading the feed, which can raise ProcessingCancelled to stop
+        self.dateWindow=None # (first date, number of days) to only keep services for, see applyDateWindow
+        self.activeServices=None # set of service IDs that run in self.dateWindow, see readTrips
+        self.minify=False # minify the template's script and CSS (dropping rules for things it doesn't have), see minifyTemplate
+    def _withProgress(self,rows,filename,fileobject,inputZip):
+        """return rows (from a CSV reader of a feed file), which call self.progress as they are read, if there is one"""
+        if self.progress is None:
+            return rows
+        return self._progressRows(rows,filename,fileobject,fileSize(filename,inputZip))
+    def _progressRows(self,rows,filename,fileobject,size):
+        for count,row in enumerate(rows):
+            if 0==count&0xfff:
+                self.progress(filename,_position(fileobject),size)
+            yield row
+        self.progress(filename,size,size)
+    def _phase(self,name):
+        """return context manager to time a phase for self.report, which does nothing if there isn't one"""
+        return _noReport if self.report is None else self.report.phase(name)
+    def _runTasks(self,tasks):
+        """runTasks, timing each task as a phase"""
+        return runTasks([(name,functools.partial(self._runPhase,name,function),dependencies) for name,function,dependencies in tasks])
+    def _runPhase(self,name,function):
+        with self._phase(name):
+            return function()
     def readAgencyName(self,inputZip):
         """read agency.txt from in the GTFS directory. Prefer agency ID for output name, agency name for agency."""
-        agencytxt=openCsv(getFile("agency.txt",inputZip))
-        headers=next(agencytxt)
-        for agencyrow in agencytxt:
-            if self.outputName is None:
-                self.outputName=agencyrow[headers.index("agency_id")]
-            if self.outputName is None:
-                self.outputName=agencyrow[headers.index("agency_name")]
-            if self.agencyName is None:
-                self.agencyName=agencyrow[headers.index("agency_name")]
-            if self.agencyName is None:
-                self.agencyName=agencyrow[headers.index("agency_id")]
+        with openFileInZip("agency.txt",inputZip) as agencyfile:
+            agencytxt=openCsv(agencyfile)
+            headers=next(agencytxt)
+            for agencyrow in agencytxt:
+                if self.outputName is None:
+                    self.outputName=agencyrow[headers.index("agency_id")]
+                if self.outputName is None:
+                    self.outputName=agencyrow[headers.index("agency_name")]
+                if self.agencyName is None:
+                    self.agencyName=agencyrow[headers.index("agency_name")]
+                if self.agencyName is None:
+                    self.agencyName=agencyrow[headers.index("agency_id")]
         self.outputName+=".html"
     def readSettings(self,lastOutput=None):
         """try to read output of the last run of this feed, and load some settings if possible.
@@ -299,190 +793,235 @@ class GtfsProcessor:
                 self._12hourClock=settings["_12hourClock"]
                 self.selectedRoutes=settings["selectedRoutes"]
                 self.excludeStops=settings["excludeStops"]
+                if self.incremental and "fingerprints" in settings:
+                    self.oldRoutes=_splitRouteFragments(fetcher.data,settings["fingerprints"])
         except:return None
         return lastOutput
+    def isSelected(self,routeReferredTo):
+        """is this route (by _routeIdColumn) selected? (no selection means all are)"""
+        return self.selectedRoutes is None or 0==len(self.selectedRoutes) or routeReferredTo in self.selectedRoutes
     def readRoutes(self,inputZip):
         """read routes.txt from GTFS directory to select which routes to process."""
-        routestxt=openCsv(getFile("routes.txt",inputZip))
-        headers=next(routestxt)
-        routeIdColumn=headers.index("route_id")
-        routeAgencyColumn=headers.index("agency_id")
-        routeShortnameColumn=headers.index("route_short_name")
-        routeLongnameColumn=headers.index("route_long_name")
-        routeReferredToColumn=headers.index(_routeIdColumn)
-        for routerow in routestxt:
-            if self.selectedRoutes is None or 0==len(self.selectedRoutes) or routerow[routeReferredToColumn] in self.selectedRoutes:
-                newroute=Route(routerow[routeIdColumn],routerow[routeAgencyColumn],routerow[routeShortnameColumn],routerow[routeLongnameColumn],routerow[routeReferredToColumn])
-                self.routes[newroute.id]=newroute
+        with openFileInZip("routes.txt",inputZip) as routesfile:
+            routestxt=openCsv(routesfile)
+            headers=next(routestxt)
+            routeIdColumn=headers.index("route_id")
+            routeAgencyColumn=headers.index("agency_id")
+            routeShortnameColumn=headers.index("route_short_name")
+            routeLongnameColumn=headers.index("route_long_name")
+            routeReferredToColumn=headers.index(_routeIdColumn)
+            for routerow in self._withProgress(routestxt,"routes.txt",routesfile,inputZip):
+                self.feedRoutes.add(routerow[routeReferredToColumn])
+                if self.isSelected(routerow[routeReferredToColumn]):
+                    newroute=Route(routerow[routeIdColumn],routerow[routeAgencyColumn],routerow[routeShortnameColumn],routerow[routeLongnameColumn],routerow[routeReferredToColumn])
+                    self.routes[newroute.id]=newroute
+            if self.report is not None:
+                self.report.countRows("routes.txt",routestxt.line_num-1,len(self.routes))
     def readTrips(self,inputZip):
-        """read trips.txt from GTFS directory, and assign trips to schedules ("trip" being a list of stops)."""
+        """read trips.txt from GTFS directory, and assign trips to schedules ("trip" being a list of stops). if self.activeServices is set, other services' trips are skipped."""
         trips={}
-        tripstxt=openCsv(getFile("trips.txt",inputZip))
-        headers=next(tripstxt)
-        tripRouteColumn=headers.index("route_id")
-        tripServiceColumn=headers.index("service_id")
-        tripIdColumn=headers.index("trip_id")
-        tripDirectionColumn=headers.index("trip_headsign")
-        for triprow in tripstxt:
-            if triprow[tripRouteColumn] in self.routes:
-                trips[triprow[tripIdColumn]]=Trip(triprow[tripRouteColumn],triprow[tripServiceColumn],triprow[tripIdColumn],triprow[tripDirectionColumn])
+        with openFileInZip("trips.txt",inputZip) as tripsfile:
+            tripstxt=openCsv(tripsfile)
+            headers=next(tripstxt)
+            tripRouteColumn=headers.index("route_id")
+            tripServiceColumn=headers.index("service_id")
+            tripIdColumn=headers.index("trip_id")
+            tripDirectionColumn=headers.index("trip_headsign")
+            for triprow in self._withProgress(tripstxt,"trips.txt",tripsfile,inputZip):
+                if triprow[tripRouteColumn] in self.routes and (self.activeServices is None or triprow[tripServiceColumn] in self.activeServices):
+                    trips[triprow[tripIdColumn]]=Trip(triprow[tripRouteColumn],triprow[tripServiceColumn],triprow[tripIdColumn],triprow[tripDirectionColumn])
+            if self.report is not None:
+                self.report.countRows("trips.txt",tripstxt.line_num-1,len(trips))
         for trip in trips.values():
             route=self.routes[trip.route]
             if trip.service not in route.schedules:
                 route.schedules[trip.service]={}
-            if trip.service not in self.schedules:
-                self.schedules.append(trip.service)
+            self.schedules.add(trip.service)
             if trip.direction not in route.schedules[trip.service]:
                 route.schedules[trip.service][trip.direction]=[]
             route.schedules[trip.service][trip.direction].append(trip)
-    def _processStopsFiles(stoptimesfile,route):
-        trips=route.getAllTrips()
-        stoptimestxt=openCsv(stoptimesfile)
-        headers=next(stoptimestxt)
-        stopTimeColumn=headers.index("arrival_time")
-        stopSequenceColumn=headers.index("stop_sequence")
-        stopIdColumn=headers.index("stop_id")
-        tripIdColumn=headers.index("trip_id")
-        pickupColumn=headers.index("pickup_type")
-        dropoffColumn=headers.index("drop_off_type")
-        for stoprow in stoptimestxt:
-            if stoprow[tripIdColumn] in trips and "1"!=stoprow[pickupColumn] and "1"!=stoprow[dropoffColumn]:
-                trip=trips[stoprow[tripIdColumn]]
-                stop=Stop(stoprow[stopTimeColumn],stoprow[stopSequenceColumn],stoprow[stopIdColumn])
-                trip.addStop(stop)
-        return route
-    def _updateRoutes(self,routes):
-        for route in routes:
-            self.routes[route.id]=route
-    def readStops(self,inputZip):
-        """read stop_times.txt from GTFS directory, and assign stops to trips of selected routes, and name stops."""
+    def readStops(self,inputZip,stops=None):
+        """read stop_times.txt from GTFS directory, and assign stops to trips of selected routes, and name stops.
+
+        stop_times.txt is scanned once, and each row is sent to its trip by trip ID. if self.parallelStops is set and the file is big enough, pieces of it are parsed by a process pool, otherwise it is parsed in this process. both ways put the same stops in the same order.
+
+        arguments:
+        stops -- optional, dictionary of stop IDs to names from _readStopNames, if stops.txt was read already
+        """
         try:
-            stoptimes=getFile("stop_times.txt",inputZip)
-            poolcount=min(len(self.routes),cpu_count())
-            with Pool(poolcount) as pool:
-                asyncresult=pool.starmap_async(GtfsProcessor._processStopsFiles,[(stoptimes,route) for route in self.routes.values()],callback=self._updateRoutes)
-                stops={}
-                stopstxt=openCsv(getFile("stops.txt",inputZip))
-                headers=next(stopstxt)
-                stopNameColumn=headers.index("stop_name")
-                stopIdColumn=headers.index("stop_id")
-                for stoprow in stopstxt:
-                    stopname=stoprow[stopNameColumn]
-                    if stopname.lower().endswith(" station"):
-                        stopname=stopname[:-8]
-                    stops[stoprow[stopIdColumn]]=stopname
-                asyncresult.wait()
-                for route in self.routes.values():
-                    for sched in route.schedules.values():
-                        for destination in sched.values():
-                            for trip in destination:
-                                for stop in trip.stops:
-                                    stop.name=stops[stop.stopid]
+            trips={}
+            for route in self.routes.values():
+                trips.update(route.getAllTrips())
+            if stops is None:
+                stops=self._readStopNames(inputZip)
+            with openFileInZip("stop_times.txt",inputZip) as stoptimesfile:
+                dialect,start=_sniffStart(stoptimesfile)
+                lines=io.StringIO(start,newline="")
+                columns=_stopTimesColumns(next(csv.reader(lines,dialect=dialect)))
+                if self._poolsStopTimes(inputZip):
+                    start=time.perf_counter()
+                    with Pool(cpu_count(),_initStopTimesWorker,(frozenset(trips),columns,_dialectParams(dialect))) as pool:
+                        details={"workers":cpu_count(),"poolStart":time.perf_counter()-start,"chunks":0}
+                        scanned=0
+                        for lineCount,chunk in _imapBounded(pool,_readStopTimesChunk,_readChunks(stoptimesfile,_stopTimesChunkSize,lines.read()),2*cpu_count()):
+                            scanned+=lineCount
+                            details["chunks"]+=1
+                            if self.progress is not None:
+                                self.progress("stop_times.txt",_position(stoptimesfile),fileSize("stop_times.txt",inputZip))
+                            for tripId,arrivalTime,sequence,stopId in chunk:
+                                trips[tripId].addStop(Stop(arrivalTime,sequence,stopId,stops[stopId]))
+                else:
+                    details={"workers":0}
+                    stoptimestxt=csv.reader(itertools.chain(lines,stoptimesfile),dialect=dialect)
+                    for tripId,arrivalTime,sequence,stopId in _filterStopTimes(self._withProgress(stoptimestxt,"stop_times.txt",stoptimesfile,inputZip),columns,trips):
+                        trips[tripId].addStop(Stop(arrivalTime,sequence,stopId,stops[stopId]))
+                    scanned=stoptimestxt.line_num
+            if self.report is not None:
+                self.report.countRows("stop_times.txt",scanned,sum(len(trip.stops) for trip in trips.values()),**details)
+        except ProcessingCancelled:
+            raise
         except (FileNotFoundError,BaseException) as ex:
             handleException(ex)
+    def _poolsStopTimes(self,inputZip):
+        """will readStops use a process pool? not when other threads are running (like a GUI's, or a server's), since its processes are forked."""
+        try:
+            return self.parallelStops and 1<cpu_count() and 1==threading.active_count() and fileSize("stop_times.txt",inputZip)>_stopTimesChunkSize
+        except (KeyError,OSError):
+            return False
+    def _readStopNames(self,inputZip):
+        """read stops.txt from GTFS directory, return dictionary of stop IDs to names."""
+        stops={}
+        with openFileInZip("stops.txt",inputZip) as stopsfile:
+            stopstxt=openCsv(stopsfile)
+            headers=next(stopstxt)
+            stopNameColumn=headers.index("stop_name")
+            stopIdColumn=headers.index("stop_id")
+            for stoprow in self._withProgress(stopstxt,"stops.txt",stopsfile,inputZip):
+                stopname=stoprow[stopNameColumn]
+                if stopname.lower().endswith(" station"):
+                    stopname=stopname[:-8]
+                stops[stoprow[stopIdColumn]]=stopname
+            if self.report is not None:
+                self.report.countRows("stops.txt",stopstxt.line_num-1,len(stops))
+        return stops
     def readSchedules(self,inputZip):
-        """read calendar.txt (daily regularly scheduled service) and calendar_dates.txt (if available) from GTFS directory. return dictionary of regularly scheduled weekday and specific dates the schedule is valid for."""
-        self.dates={0:[],1:[],2:[],3:[],4:[],5:[],6:[]}
-        day=datetime.timedelta(days=1)
-        caltxt=openCsv(getFile("calendar.txt",inputZip))
-        headers=next(caltxt)
-        startDateColumn=headers.index("start_date")
-        endDateColumn=headers.index("end_date")
-        serviceIdColumn=headers.index("service_id")
-        mondayColumn=headers.index("monday")
-        tuesdayColumn=headers.index("tuesday")
-        wednesdayColumn=headers.index("wednesday")
-        thursdayColumn=headers.index("thursday")
-        fridayColumn=headers.index("friday")
-        saturdayColumn=headers.index("saturday")
-        sundayColumn=headers.index("sunday")
-        for calrow in caltxt:
-            testdate=parseDate(calrow[startDateColumn])
-            enddate=parseDate(calrow[endDateColumn])
-            # sometimes there are schedules that should really be exceptions
-            # (since they are only valid for one day),
-            # and should not be confused with regular service
-            if "1"==calrow[sundayColumn] and calrow[startDateColumn]!=calrow[endDateColumn]:
-                self.dates[0].append(calrow[serviceIdColumn])
-            if "1"==calrow[mondayColumn] and calrow[startDateColumn]!=calrow[endDateColumn]:
-                self.dates[1].append(calrow[serviceIdColumn])
-            if "1"==calrow[tuesdayColumn] and calrow[startDateColumn]!=calrow[endDateColumn]:
-                self.dates[2].append(calrow[serviceIdColumn])
-            if "1"==calrow[wednesdayColumn] and calrow[startDateColumn]!=calrow[endDateColumn]:
-                self.dates[3].append(calrow[serviceIdColumn])
-            if "1"==calrow[thursdayColumn] and calrow[startDateColumn]!=calrow[endDateColumn]:
-                self.dates[4].append(calrow[serviceIdColumn])
-            if "1"==calrow[fridayColumn] and calrow[startDateColumn]!=calrow[endDateColumn]:
-                self.dates[5].append(calrow[serviceIdColumn])
-            if "1"==calrow[saturdayColumn] and calrow[startDateColumn]!=calrow[endDateColumn]:
-                self.dates[6].append(calrow[serviceIdColumn])
-            while testdate != enddate:
-                datestr=formatDate(testdate)
-                if datestr not in self.dates:
-                    self.dates[datestr]=[]
-                dayofweek=testdate.weekday()
-                if (0==dayofweek and "1"==calrow[mondayColumn]) or \
-                    (1==dayofweek and "1"==calrow[tuesdayColumn]) or \
-                    (2==dayofweek and "1"==calrow[wednesdayColumn]) or \
-                    (3==dayofweek and "1"==calrow[thursdayColumn]) or \
-                    (4==dayofweek and "1"==calrow[fridayColumn]) or \
-                    (5==dayofweek and "1"==calrow[saturdayColumn]) or \
-                    (6==dayofweek and "1"==calrow[sundayColumn]):
-                    self.dates[datestr].append(calrow[serviceIdColumn])
-                testdate+=day
+        """read calendar.txt (daily regularly scheduled service) and calendar_dates.txt (if available) from GTFS directory, into self.calendar. the calendar is kept like it is in the feed (not a list of every day), and the output resolves it for a date when needed.
+
+        self.calendar has:
+        weekdays -- list of service IDs for each day of the week (Sunday first), used when a date is not covered by the calendar
+        services -- list of [service ID, start date, end date (not included), days of the week (bit 0 is Sunday)]
+        exceptions -- dictionary of dates to lists of [service ID, 1 (added) or 2 (removed)], in feed order
+        """
+        self.calendar={"weekdays":[[] for weekday in range(7)],"services":[],"exceptions":{}}
+        with openFileInZip("calendar.txt",inputZip) as calfile:
+            caltxt=openCsv(calfile)
+            headers=next(caltxt)
+            startDateColumn=headers.index("start_date")
+            endDateColumn=headers.index("end_date")
+            serviceIdColumn=headers.index("service_id")
+            weekdayColumns=[headers.index(weekday) for weekday in ("sunday","monday","tuesday","wednesday","thursday","friday","saturday")]
+            for calrow in self._withProgress(caltxt,"calendar.txt",calfile,inputZip):
+                weekdays=0
+                for weekday,column in enumerate(weekdayColumns):
+                    if "1"==calrow[column]:
+                        weekdays|=1<<weekday
+                        # sometimes there are schedules that should really be exceptions
+                        # (since they are only valid for one day),
+                        # and should not be confused with regular service
+                        if calrow[startDateColumn]!=calrow[endDateColumn]:
+                            self.calendar["weekdays"][weekday].append(calrow[serviceIdColumn])
+                self.calendar["services"].append([calrow[serviceIdColumn],formatDate(parseDate(calrow[startDateColumn])),formatDate(parseDate(calrow[endDateColumn])),weekdays])
+            if self.report is not None:
+                self.report.countRows("calendar.txt",caltxt.line_num-1,len(self.calendar["services"]))
 
         # exceptions to regularly scheduled service
-        caltxt=openCsv(getFile("calendar_dates.txt",inputZip,shouldExitOnError=False))
-        headers=next(caltxt)
-        dateColumn=headers.index("date")
-        exceptionColumn=headers.index("exception_type")
-        serviceIdColumn=headers.index("service_id")
-        if caltxt is None:
+        calfile=openFileInZip("calendar_dates.txt",inputZip,shouldExitOnError=False)
+        if calfile is None:
             return
-        for calrow in caltxt:
-            dateexc=parseDate(calrow[dateColumn])
-            datestr=formatDate(dateexc)
-            if "1"==calrow[exceptionColumn]:
-                if datestr not in self.dates:
-                    self.dates[datestr]=[]
-                self.dates[datestr].append(calrow[serviceIdColumn])
-            elif "2"==calrow[exceptionColumn] and datestr in self.dates and calrow[serviceIdColumn] in self.dates[datestr]:
-                self.dates[datestr].remove(calrow[serviceIdColumn])
+        with calfile:
+            caltxt=openCsv(calfile)
+            headers=next(caltxt)
+            dateColumn=headers.index("date")
+            exceptionColumn=headers.index("exception_type")
+            serviceIdColumn=headers.index("service_id")
+            for calrow in self._withProgress(caltxt,"calendar_dates.txt",calfile,inputZip):
+                if calrow[exceptionColumn] in ("1","2"):
+                    datestr=formatDate(parseDate(calrow[dateColumn]))
+                    if datestr not in self.calendar["exceptions"]:
+                        self.calendar["exceptions"][datestr]=[]
+                    self.calendar["exceptions"][datestr].append([calrow[serviceIdColumn],int(calrow[exceptionColumn])])
+            if self.report is not None:
+                self.report.countRows("calendar_dates.txt",caltxt.line_num-1,sum(len(exceptions) for exceptions in self.calendar["exceptions"].values()))
+    def applyDateWindow(self):
+        """keep only services that run in self.dateWindow: set self.activeServices, trim calendar to the window, and drop other services' trips from routes (if there are any yet). dates outside the window are left to the weekday fallback in the output."""
+        self._trimCalendar()
+        self.schedules=set()
+        for route in self.routes.values():
+            route.schedules={service:directions for service,directions in route.schedules.items() if service in self.activeServices}
+            self.schedules.update(route.schedules)
+    def _trimCalendar(self):
+        """set self.activeServices to services that run in self.dateWindow, and trim calendar to it. doing this again changes nothing."""
+        firstDate,days=self.dateWindow
+        start,end=formatDate(firstDate),formatDate(firstDate+datetime.timedelta(days=days))
+        self.activeServices=set()
+        for day in range(days):
+            self.activeServices.update(servicesOn(self.calendar,firstDate+datetime.timedelta(days=day)) or ())
+        self.calendar["services"]=[[service[0],max(service[1],start),min(service[2],end),service[3]] for service in self.calendar["services"] if service[1]<end and start<service[2]]
+        self.calendar["exceptions"]={date:exceptions for date,exceptions in self.calendar["exceptions"].items() if start<=date<end}
     def buildDataModel(self):
         """gather trips into route schedules, delete unneccessary schedules, and sort trips within route schedules."""
-        for dayschedules in self.dates.values():
-            for schedule in dayschedules[:]:
-                if schedule not in self.schedules:
-                    dayschedules.remove(schedule)
+        for dayschedules in self.calendar["weekdays"]:
+            dayschedules[:]=[schedule for schedule in dayschedules if schedule in self.schedules]
+        # unused services still say which dates the calendar covers, but not what runs on them
+        for service in self.calendar["services"]:
+            if service[0] not in self.schedules:
+                service[0]=None
+                service[3]=0
+        for exceptions in self.calendar["exceptions"].values():
+            exceptions[:]=[exception if exception[0] in self.schedules else [None,1] for exception in exceptions if exception[0] in self.schedules or 1==exception[1]]
         for route in self.routes.values():
             route.finalize(self.excludeStops)
             for schedule in route.schedules.values():
                 for destination in schedule.values():
-                    destination.sort()
+                    destination.sort(key=_tripOrder)
     def formatOutputVars(self):
-        """create output variable object for insertion into template."""
+        """create output variable object for insertion into template. the script is made as it is written (see writeTemplate), so all of it doesn't need to be in memory at once."""
         self.outputVars={"title":self.agencyName,"headerTitle":self.agencyName,"generationDate":email.utils.formatdate(localtime=True)}
-        routeSelect=""
-        tables=""
-        tableTemplate="\t<input type='radio' name='line' value='{0}' id='radio-{0}'/>\n\t<section id='{0}'>\n\t\t<h1>{1}</h1>\n\t</section>\n"
-        for route in (route for route in self.routes.values() if len(self.selectedRoutes) is 0 or route.referredTo in self.selectedRoutes):
-            routeSelect+="\t<label for='radio-{1}'>{0}</label>\n".format(route.shortname,route.id)
-            tables+=tableTemplate.format(route.id,route.longname)
-        self.outputVars["ttimesettings"]=removeSpaces(json.dumps({"selectedRoutes":self.selectedRoutes,"excludeStops":self.excludeStops,"_12hourClock":self._12hourClock}))
-        self.outputVars["html"]=routeSelect+tables
-        self.outputVars["javascript"]="const dates={0};\nconst routes={1};\nconst _12hourClock={2};\n".format(removeSpaces(self.dates.__str__()),removeSpaces(self.routes.__str__().replace("'\\x00'","null")),str(self._12hourClock).lower())
+        routeSelect=[]
+        tables=[]
+        for route in (route for route in self.routes.values() if self.isSelected(route.referredTo)):
+            routeSelect.append(_routeLabelHtml.format(route.shortname,route.id))
+            tables.append(_routeSectionHtml.format(route.id,route.longname))
+        settings={"selectedRoutes":self.selectedRoutes,"excludeStops":self.excludeStops,"_12hourClock":self._12hourClock}
+        if self.incremental:
+            # fingerprints are written before the routes, so routes need to be output first
+            fragments=[(route.id,route.getOutput(self.routeEncoding)) for route in self.routes.values()]
+            settings["fingerprints"]={routeId:[self.routes[routeId].fingerprint,len(fragment)] for routeId,fragment in fragments}
+        else:
+            fragments=((route.id,route.getOutput(self.routeEncoding)) for route in self.routes.values())
+        self.outputVars["ttimesettings"]=toJson(settings)
+        self.outputVars["html"]="".join(routeSelect+tables)
+        self.outputVars["data"]=self._formatData(fragments)
+    def _formatData(self,fragments):
+        """yield JSON data for the output piece by piece, given (route ID, route output) pairs"""
+        yield '{"routes":{'
+        separator=""
+        for routeId,fragment in fragments:
+            yield separator+toJson(routeId)+":"
+            yield fragment if self.report is None else self.report.countOutput("data.routes",fragment)
+            separator=","
+        yield '},"calendar":'
+        yield toJson(self.calendar) if self.report is None else self.report.countOutput("data.calendar",toJson(self.calendar))
+        yield ',"routeEncoding":{0},"_12hourClock":{1}}}'.format(toJson(self.routeEncoding),toJson(self._12hourClock))
     def readCss(self,cssFilename="t-time.css"):
         """read entire CSS file.
 
         arguments:
         cssFilename -- optional, if CSS is different than t-time.css
         """
-        self.css="<style>"
         try:
             with open(cssFilename,"r",encoding="utf-8") as cssfile:
-                for line in cssfile:
-                    self.css+=line
-            self.css+="</style>"
+                self.css="<style>"+cssfile.read()+"</style>"
         except BaseException as ex:
             self.css=None
     def readHtmlTemplate(self,templateFilename="t-time.html"):
@@ -494,50 +1033,682 @@ class GtfsProcessor:
         template=""
         try:
             with open(templateFilename,"r",encoding="utf-8") as templatefile:
-                for line in templatefile:
-                    template+=line
+                template=templatefile.read()
         except (FileNotFoundError,BaseException) as ex:
             handleException(ex,
                 "File {0} does not exist. This is the HTML template to export the data.".format(ex.filename),
                 "There was a problem opening {0}. This is the HTML template to export the data.".format(ex.filename))
-        if self.css is not None:
-            template=template.replace('<link rel="stylesheet" href="t-time.css" />',self.css,1)
+        css=self.css
+        if self.minify:
+            template,css=self.minifyTemplate(template,css,templateFilename)
+        if css is not None:
+            template=template.replace('<link rel="stylesheet" href="t-time.css" />',css,1)
         self.template=Template(template)
+    def minifyTemplate(self,template,css,templateFilename):
+        """return template and CSS from minifyTemplate. the last result is kept next to the template (by a hash of what went in), so it is only done again when the template, CSS, or _minifyVersion change."""
+        key=hashlib.sha1("{0}\0{1}\0{2}".format(_minifyVersion,template,css).encode("utf-8")).hexdigest()
+        cacheName=templateFilename+_cacheSuffix
+        try:
+            with open(cacheName,"rb") as cache:
+                if _hasCacheKey(cache,key):
+                    return pickle.load(cache)
+        except Exception:
+            pass
+        before=len(template)+len(css or "")
+        minified=minifyTemplate(template,css)
+        print("Minified template and CSS from {0:.1f} KB to {1:.1f} KB".format(before/1024,(len(minified[0])+len(minified[1] or ""))/1024))
+        temporary=tempName(cacheName)
+        try:
+            with open(temporary,"wb") as cache:
+                _writeCacheKey(cache,key)
+                pickle.dump(minified,cache,pickle.HIGHEST_PROTOCOL)
+            replace(temporary,cacheName)
+        except OSError:
+            try:
+                remove(temporary)
+            except OSError:
+                pass
+        return minified
     def writeHtml(self):
         """use output variables on template, and write HTML file. return output filename"""
         try:
             with open(self.outputName,"w",encoding="utf-8") as output:
-                output.write(self.template.substitute(self.outputVars))
+                if self.report is None:
+                    writeTemplate(self.template,self.outputVars,output)
+                else:
+                    writeTemplate(self.template,{name:self.report.countOutput(name,value) for name,value in self.outputVars.items()},output)
+            if self.report is not None:
+                self.report.countOutput("css",self.css or "")
+                self.report.output["file"]=stat(self.outputName).st_size
         except BaseException as ex:
             print("There was a problem writing {0}. This was to be the output file, but it cannot be created or written, or something.".format(ex.filename))
             exit(73)
         return self.outputName
-    def completeOutput(self):
-        self.readCss()
-        self.formatOutputVars()
-        self.readHtmlTemplate()
-        return self.writeHtml()
-    def run(self,inputZip):
+    def templateTasks(self):
+        """return tasks (see runTasks) that read CSS and the HTML template, to run along with others before completeOutput(templateRead=True)"""
+        return [("readCss",self.readCss,()),("readHtmlTemplate",self.readHtmlTemplate,("readCss",))]
+    def completeOutput(self,templateRead=False):
+        """format output variables and write them to the template, reading CSS and the template first unless templateRead. return output filename"""
+        if not templateRead:
+            with self._phase("readCss"):
+                self.readCss()
+        with self._phase("formatOutputVars"):
+            self.formatOutputVars()
+        if not templateRead:
+            with self._phase("readHtmlTemplate"):
+                self.readHtmlTemplate()
+        with self._phase("writeHtml"):
+            return self.writeHtml()
+    def getModel(self):
+        """return routes (with trips and stops) and calendar read from the feed, before buildDataModel, as bytes for setModel. each route is pickled separately, so that unselected (or reused, see self.incremental) routes don't need to be loaded."""
+        routes=[_routeRecord(route) for route in self.routes.values()]
+        return pickle.dumps((routes,self.calendar),pickle.HIGHEST_PROTOCOL)
+    def setModel(self,model):
+        """load routes and calendar from getModel, keeping selected routes. can be called repeatedly with the same model, since each call gets its own copy.
+
+        if self.incremental, routes get a fingerprint, and routes with the same fingerprint as in the last output get its output instead of their data. if there is a date window, the calendar is trimmed to it first, so that fingerprints are of the services kept.
+        """
+        routes,calendar=pickle.loads(model)
+        self._setRoutes(routes,calendar)
+    def _setRoutes(self,routes,calendar):
+        """setModel, with routes as a list of _routeRecord"""
+        self.calendar=calendar
+        if self.dateWindow is not None:
+            self._trimCalendar()
+        self.routes={}
+        self.schedules=set()
+        for routeInfo,schedules,route in routes:
+            if not self.isSelected(routeInfo[4]):
+                continue
+            if self.incremental:
+                kept=None if self.dateWindow is None else [service for service in schedules if service in self.activeServices]
+                fingerprint=routeFingerprint(route,self.excludeStops.get(routeInfo[4]),self.routeEncoding,kept)
+                if routeInfo[0] in self.oldRoutes and fingerprint==self.oldRoutes[routeInfo[0]][0]:
+                    route=Route(*routeInfo)
+                    route.fragment=self.oldRoutes[route.id][1]
+                    # services without trips, so that they are kept in the calendar (and trimmed by applyDateWindow)
+                    route.schedules={service:{} for service in schedules}
+                else:
+                    route=pickle.loads(route)
+                route.fingerprint=fingerprint
+            else:
+                route=pickle.loads(route)
+            self.routes[route.id]=route
+            self.schedules.update(schedules)
+    def cacheName(self,inputZip):
+        """return filename of the cache for this feed (next to the zip), or None if there isn't one"""
+        if not self.useCache or inputZip is None or not getattr(inputZip,"filename",None):
+            return None
+        return inputZip.filename+_cacheSuffix
+    def loadCache(self,inputZip):
+        """load selected routes and calendar from cache, if it exists, was made from the same zip (and version of this), and has every selected route. only those routes are read from it. return True if it was loaded.
+
+        the cache is unpickled, so it must only be written by this (or someone trusted): anyone who can write a file next to the zip can make one that runs code when loaded. a file that doesn't start with the zip's key isn't unpickled.
+        """
+        cacheName=self.cacheName(inputZip)
+        if cacheName is None:
+            return False
+        try:
+            with open(cacheName,"rb") as cache:
+                if not _hasCacheKey(cache,feedKey(inputZip)):
+                    return False
+                calendar,feedRoutes,records=_readCacheIndex(cache)
+                cached={routeInfo[4] for routeInfo,schedules,offset,length in records}
+                if any(self.isSelected(route) and route not in cached for route in feedRoutes):
+                    return False
+                routes=[]
+                for routeInfo,schedules,offset,length in records:
+                    if self.isSelected(routeInfo[4]):
+                        cache.seek(offset)
+                        routes.append((routeInfo,schedules,cache.read(length)))
+            self._setRoutes(routes,calendar)
+            return True
+        except Exception:
+            return False
+    def saveCache(self,inputZip):
+        """write routes read (before finalize) and calendar to cache, with routes already in it (from the same zip) that weren't read this time, so that runs with other routes selected add to it. each route can be read from it by itself (see loadCache): the file has the feed key (see _writeCacheKey), then pickled routes, then their index (see _readCacheIndex), then where that index starts. return True if it was written."""
+        cacheName=self.cacheName(inputZip)
+        if cacheName is None:
+            return False
+        key=feedKey(inputZip)
+        oldCache=None
+        oldRecords=[]
+        try:
+            oldCache=open(cacheName,"rb")
+            if _hasCacheKey(oldCache,key):
+                oldRecords=[record for record in _readCacheIndex(oldCache)[2] if record[0][0] not in self.routes]
+        except Exception:
+            oldRecords=[]
+        temporary=tempName(cacheName)
+        try:
+            with open(temporary,"wb") as cache:
+                _writeCacheKey(cache,key)
+                records=[]
+                for route in self.routes.values():
+                    routeInfo,schedules,pickled=_routeRecord(route)
+                    records.append((routeInfo,schedules,cache.tell(),len(pickled)))
+                    cache.write(pickled)
+                for routeInfo,schedules,offset,length in oldRecords:
+                    oldCache.seek(offset)
+                    records.append((routeInfo,schedules,cache.tell(),length))
+                    cache.write(oldCache.read(length))
+                index=cache.tell()
+                pickle.dump((self.calendar,self.feedRoutes,records),cache,pickle.HIGHEST_PROTOCOL)
+                cache.write(index.to_bytes(8,"little"))
+            if oldCache is not None:
+                oldCache.close()
+            replace(temporary,cacheName)
+        except OSError:
+            print("Could not write cache {0}, continuing without it.".format(cacheName))
+            try:
+                remove(temporary)
+            except OSError:
+                pass
+            return False
+        finally:
+            if oldCache is not None:
+                oldCache.close()
+        return True
+    def clearCache(self,inputZip):
+        """delete cache for this feed, if there is one. return its filename if it was deleted."""
+        cacheName=self.cacheName(inputZip)
+        try:
+            remove(cacheName)
+        except (TypeError,OSError):
+            return None
+        return cacheName
+    def readFeed(self,inputZip,alongside=()):
+        """read routes, trips, stops, and schedules from GTFS directory for selected routes. if there is a cache, they are added to it. if there is a date window, schedules are read first, so that only trips (and stops) of services in it are read.
+
+        routes.txt, trips.txt, and stop_times.txt need each other in that order, but stops.txt and the calendar don't, so they are read by runTasks at the same time, along with alongside (more tasks, like templateTasks). errors are those of reading them one after another. when stop_times.txt is read by a process pool, that is done here after the others, once runTasks' threads have finished.
+        """
+        def readRoutes():
+            self.readRoutes(inputZip)
+            print("Routes read")
+        def readTrips():
+            self.readTrips(inputZip)
+            print("Trips read")
+        def readStopNames():
+            stopNames.update(self._readStopNames(inputZip))
+        def readStops():
+            print("Reading stops (please stand by)")
+            self.readStops(inputZip,stopNames)
+            print("Stops read")
+        def readSchedules():
+            self.readSchedules(inputZip)
+            if self.dateWindow is not None:
+                self.applyDateWindow()
+        # a feed read for a date window isn't all there, so it isn't cached
+        caching=self.cacheName(inputZip) is not None and self.dateWindow is None
+        stopNames={}
+        if self.dateWindow is None:
+            tasks=[("readRoutes",readRoutes,())]
+            later=[("readSchedules",readSchedules,())]
+        else:
+            # trips of services outside the window are skipped, so the calendar comes first
+            tasks=[("readSchedules",readSchedules,()),("readRoutes",readRoutes,("readSchedules",))]
+            later=[]
+        tasks.extend((("readTrips",readTrips,("readRoutes",)),("readStopNames",readStopNames,())))
+        later.extend(alongside)
+        # the pool's processes are forked, which is only safe when there are no other threads, so it waits until runTasks' have ended
+        poolsStopTimes=self._poolsStopTimes(inputZip)
+        if not poolsStopTimes:
+            tasks.append(("readStops",readStops,("readTrips","readStopNames")))
+        tasks.extend(later)
+        self._runTasks(tasks)
+        if poolsStopTimes:
+            self._runPhase("readStops",readStops)
+        if caching:
+            with self._phase("saveCache"):
+                self.saveCache(inputZip)
+        if self.incremental:
+            with self._phase("setModel"):
+                self.setModel(self.getModel())
+    def run(self,inputZip=None):
         """automatically run things the way they were meant to be run with (hopefully reasonable) defaults."""
-        self.readAgencyName(inputZip)
-        oldFile=self.readSettings()
+        with self._phase("readSettings"):
+            self.readAgencyName(inputZip)
+            oldFile=self.readSettings()
         if oldFile is not None:
             print("Found old file {0} and imported old settings.".format(oldFile))
-        self.readRoutes(inputZip)
-        print("Routes read")
-        self.readTrips(inputZip)
-        print("Trips read")
-        print("Reading stops (please stand by)")
-        self.readStops(inputZip)
-        print("Stops read")
-        self.readSchedules(inputZip)
-        self.buildDataModel()
+        with self._phase("loadCache"):
+            cached=self.loadCache(inputZip)
+        if cached:
+            print("Read feed from cache {0}".format(self.cacheName(inputZip)))
+            if self.dateWindow is not None:
+                self.applyDateWindow()
+            self._runTasks(self.templateTasks())
+        else:
+            self.readFeed(inputZip,self.templateTasks())
+        if self.incremental:
+            print("Reused {0} of {1} routes from old file".format(sum(1 for route in self.routes.values() if route.fragment is not None),len(self.routes)))
+        with self._phase("buildDataModel"):
+            self.buildDataModel()
+        if self.report is not None:
+            self.report.countRoutes(self.routes)
         print("Schedules assigned")
-        print("Wrote {0} as final output. Have a nice trip!".format(self.completeOutput()))
+        print("Wrote {0} as final output. Have a nice trip!".format(self.completeOutput(templateRead=True)))
 
-if "__main__"==__name__:
-    if len(argv)>1:
-        with zipfile.ZipFile(argv[1]) as inputZipObject:
-            GtfsProcessor().run(inputZipObject)
+sys.modules.setdefault(_moduleName,sys.modules[__name__])
+for _pickledClass in (Route,Trip,Stop):
+    _pickledClass.__module__=_moduleName
+
+def _parseFeed(feedName,useCache=True,parallelStops=True):
+    """read every route of a GTFS zip (or its cache). return the GtfsProcessor that read it (for the agency, and default output name, next to the zip), and its model (see GtfsProcessor.getModel)."""
+    gtfs=GtfsProcessor()
+    gtfs.useCache=useCache
+    gtfs.parallelStops=parallelStops
+    try:
+        inputZip=zipfile.ZipFile(feedName)
+    except (FileNotFoundError,BaseException) as ex:
+        handleException(ex,
+            "File {0} does not exist. This is the GTFS zip file to process.".format(feedName),
+            "There was a problem opening {0}. This is the GTFS zip file to process.".format(feedName))
+    with inputZip:
+        gtfs.readAgencyName(inputZip)
+        if not gtfs.loadCache(inputZip):
+            gtfs.readFeed(inputZip)
+    gtfs.outputName=os.path.join(os.path.dirname(feedName),gtfs.outputName)
+    model=gtfs.getModel()
+    # routes are in the model now, and each output gets its own from it
+    gtfs.routes={}
+    return gtfs,model
+def _renderOutput(gtfs,model,output,options):
+    """write an output of a feed read by _parseFeed. output is a dictionary of settings (see runBatch), options has incremental, routeEncoding, and minify. return the GtfsProcessor that wrote it."""
+    render=GtfsProcessor(output.get("outputName",gtfs.outputName),output.get("title",gtfs.agencyName))
+    render.incremental=options["incremental"]
+    render.routeEncoding=output.get("routeEncoding",options["routeEncoding"])
+    render.minify=options["minify"]
+    render.readSettings()
+    for setting in ("selectedRoutes","excludeStops","_12hourClock"):
+        if setting in output:
+            setattr(render,setting,output[setting])
+    render.dateWindow=options["dateWindow"]
+    render.setModel(model)
+    if render.dateWindow is not None:
+        render.applyDateWindow()
+    render.buildDataModel()
+    render.completeOutput()
+    return render
+class DepartureIndex:
+    """next departures from stops of a feed, to answer queries without writing an output. see nextDepartures
+
+    departures -- dictionary of (route ID, stop ID) to dictionaries of service IDs to (list of times in seconds since the start of the service day, in order; list of (route, direction, trip ID) in the same order)
+    routeIds -- dictionary of route IDs and _routeIdColumn values to sets of route IDs
+    stopIds -- dictionary of stop IDs and names to sets of stop IDs
+    routesAt -- dictionary of stop IDs to sets of route IDs that stop there
+    """
+    def __init__(self,routes,calendar):
+        """index trips of routes (dictionary of route IDs to routes, before finalize), and keep calendar (see GtfsProcessor.readSchedules) to find services on dates"""
+        self.calendar=calendar
+        self.routeIds={}
+        self.stopIds={}
+        self.routesAt={}
+        self.servicesByDate={}
+        departures={}
+        for route in routes.values():
+            self.routeIds.setdefault(route.id,set()).add(route.id)
+            self.routeIds.setdefault(route.referredTo,set()).add(route.id)
+            for service,directions in route.schedules.items():
+                for direction,trips in directions.items():
+                    for trip in trips:
+                        for stop in trip.stops:
+                            departures.setdefault((route.id,stop.stopid),{}).setdefault(service,[]).append((timeSeconds(stop.time),route.referredTo,direction,trip.trip))
+                            self.routesAt.setdefault(stop.stopid,set()).add(route.id)
+                            self.stopIds.setdefault(stop.stopid,set()).add(stop.stopid)
+                            if stop.name is not None:
+                                self.stopIds.setdefault(stop.name,set()).add(stop.stopid)
+        self.departures={}
+        for key,services in departures.items():
+            self.departures[key]={}
+            for service,stops in services.items():
+                stops.sort()
+                self.departures[key][service]=([stop[0] for stop in stops],[stop[1:] for stop in stops])
+    def servicesOn(self,date):
+        """return service IDs that run on a date (see servicesOn), or those of its day of the week if the calendar doesn't cover it, like the output does. each is listed once."""
+        services=self.servicesByDate.get(date)
+        if services is None:
+            services=servicesOn(self.calendar,date)
+            if services is None:
+                services=self.calendar["weekdays"][date.isoweekday()%7]
+            # a service can be listed twice (like when calendar_dates.txt adds it on a day calendar.txt has it)
+            services=list(dict.fromkeys(services))
+            self.servicesByDate[date]=services
+        return services
+    def nextDepartures(self,stop,route=None,when=None,count=5):
+        """return up to count departures from a stop (by ID or name) at or after when (a datetime, default now), as a list of (datetime, route, direction, trip ID) in order. route (by ID or _routeIdColumn) limits them to one route. trips of the day before that run past midnight are included. each service's times are found by binary search."""
+        if when is None:
+            when=datetime.datetime.now()
+        found=[]
+        days=[]
+        for day in (when.date()-datetime.timedelta(days=1),when.date()):
+            start=datetime.datetime.combine(day,datetime.time())
+            days.append((start,(when-start).total_seconds(),self.servicesOn(day)))
+        for stopId in self.stopIds.get(stop,()):
+            for routeId in self.routesAt[stopId] if route is None else self.routeIds.get(route,()):
+                services=self.departures.get((routeId,stopId))
+                if services is None:
+                    continue
+                for start,seconds,dayServices in days:
+                    for service in dayServices:
+                        if service not in services:
+                            continue
+                        times,trips=services[service]
+                        first=bisect.bisect_left(times,seconds)
+                        for index in range(first,min(first+count,len(times))):
+                            found.append((start+datetime.timedelta(seconds=times[index]),)+trips[index])
+        found.sort()
+        return found[:count]
+def loadDepartureIndex(feedName,useCache=True):
+    """read every route of a GTFS zip (or its cache), and return a DepartureIndex of it"""
+    gtfs,model=_parseFeed(feedName,useCache)
+    gtfs.setModel(model)
+    return DepartureIndex(gtfs.routes,gtfs.calendar)
+def _runBatchFeed(job):
+    """parse one feed of a batch manifest (see runBatch), and write each of its outputs. return list of (output name, exit code, message)."""
+    feedName,outputs,options=job
+    results=[]
+    log=io.StringIO()
+    try:
+        with contextlib.redirect_stdout(log):
+            # this is already in a worker process, which can't have its own
+            gtfs,model=_parseFeed(feedName,options["useCache"],parallelStops=False)
+    except SystemExit as ex:
+        return [(output.get("outputName",feedName),ex.code,log.getvalue().strip()) for output in outputs]
+    except Exception as ex:
+        return [(output.get("outputName",feedName),1,str(ex)) for output in outputs]
+    for output in outputs:
+        log=io.StringIO()
+        try:
+            with contextlib.redirect_stdout(log):
+                render=_renderOutput(gtfs,model,output,options)
+            results.append((render.outputName,0,"{0} routes".format(len(render.routes))))
+        except SystemExit as ex:
+            results.append((output.get("outputName",gtfs.outputName),ex.code,log.getvalue().strip()))
+        except Exception as ex:
+            results.append((output.get("outputName",gtfs.outputName),1,str(ex)))
+    return results
+def runBatch(manifestName,jobs=None,useCache=True,incremental=False,routeEncoding=None,minify=False,dateWindow=None):
+    """write many outputs from many feeds, as listed in a JSON manifest, with a process pool. each feed is parsed once (by one process), and rendered for each of its outputs. return exit code: 0, or that of the first failed output.
+
+    the manifest is a list of feeds, like [{"feed":"PAAC.zip","outputs":[{"outputName":"PAAC.html"},{"outputName":"T.html","selectedRoutes":["RED","BLUE"]}]}]. filenames are relative to the manifest, and outputs are named after the agency (next to the feed) by default. outputs can have settings like in the output (selectedRoutes, excludeStops, _12hourClock), and title and routeEncoding. settings that aren't given are read from the output file if it exists, like when running one feed.
+    """
+    try:
+        with open(manifestName,"r",encoding="utf-8") as manifestFile:
+            manifest=json.load(manifestFile)
+    except (FileNotFoundError,BaseException) as ex:
+        handleException(ex,
+            "File {0} does not exist. This is the list of feeds to process.".format(manifestName),
+            "There was a problem reading {0}. This is the list of feeds to process.".format(manifestName))
+    base=os.path.dirname(os.path.abspath(manifestName))
+    options={"useCache":useCache,"incremental":incremental,"routeEncoding":routeEncoding,"minify":minify,"dateWindow":dateWindow}
+    feeds=OrderedDict() # resolved zip filenames to (zip filename, outputs), so a feed listed more than once is still parsed once
+    for feed in manifest:
+        outputs=[dict(output,outputName=os.path.join(base,output["outputName"])) if "outputName" in output else output for output in feed.get("outputs",[{}])]
+        feedName=os.path.join(base,feed["feed"])
+        feeds.setdefault(os.path.realpath(feedName),(feedName,[]))[1].extend(outputs)
+    work=[(feedName,outputs,options) for feedName,outputs in feeds.values()]
+    code=0
+    with Pool(min(jobs or cpu_count(),len(work)) or 1) as pool:
+        for (feedName,outputs,options),results in zip(work,pool.imap(_runBatchFeed,work)):
+            for outputName,result,message in results:
+                if 0==result:
+                    print("{0} -> {1}: done, {2}".format(feedName,outputName,message))
+                else:
+                    print("{0} -> {1}: failed ({2}) {3}".format(feedName,outputName,result,message))
+                    code=code or result
+    return code
+class FeedWatcher:
+    """keeps feeds in a directory read, and writes their outputs again when they change. a feed (like PAAC.zip) can have settings for its outputs next to it (PAAC.json), which is a list of outputs like those in runBatch. when only settings change, outputs are written from the feed already read. feeds are kept in memory, and caches (see GtfsProcessor.loadCache) in the directory are not used, since whoever can put feeds there could put a cache there that runs code when it is loaded.
+
+    pages -- dictionary of output filenames (without directory) to (body, gzipped body, ETag, Last-Modified time) of the last output written, see WatchRequestHandler. pages of outputs that are no longer in settings, or of zips that were deleted, are dropped.
+    """
+    def __init__(self,directory,incremental=False,routeEncoding=None,minify=False,dateWindow=None):
+        self.directory=directory
+        self.options={"incremental":incremental,"routeEncoding":routeEncoding,"minify":minify,"dateWindow":dateWindow}
+        self.feeds={} # zip filenames to (GtfsProcessor, model) from _parseFeed
+        self.seen=None # filenames to (modified time, size) at the last poll
+        self.used={} # filenames to (modified time, size) when they were last used
+        self.pages={}
+        self.pageNames={} # zip filenames to names of their outputs in self.pages
+    def poll(self):
+        """look for new or changed feeds and settings, and write their outputs. files are only used once they are the same for two polls, so they are not read while being copied (except at the first poll). return number of outputs written."""
+        seen={}
+        for entry in scandir(self.directory):
+            if entry.is_file() and entry.name.endswith((".zip",".json")):
+                status=entry.stat()
+                seen[entry.path]=(status.st_mtime_ns,status.st_size)
+        last=seen if self.seen is None else self.seen
+        self.seen=seen
+        written=0
+        for feedName,signature in seen.items():
+            settingsName=feedName[:-4]+".json"
+            if not feedName.endswith(".zip") or last.get(feedName)!=signature or last.get(settingsName)!=seen.get(settingsName):
+                continue
+            feedChanged=self.used.get(feedName)!=signature
+            if not feedChanged and self.used.get(settingsName)==seen.get(settingsName):
+                continue
+            self.used[feedName]=signature
+            self.used[settingsName]=seen.get(settingsName)
+            if feedChanged or feedName not in self.feeds:
+                self.feeds.pop(feedName,None)
+                start=time.perf_counter()
+                log=io.StringIO()
+                try:
+                    with contextlib.redirect_stdout(log):
+                        self.feeds[feedName]=_parseFeed(feedName,useCache=False)
+                except (SystemExit,Exception) as ex:
+                    print("Could not read {0}: {1}".format(feedName,log.getvalue().strip() or ex))
+                    continue
+                print("Read {0} in {1:.1f}s".format(feedName,time.perf_counter()-start))
+            outputs=[{}]
+            if settingsName in seen:
+                try:
+                    with open(settingsName,"r",encoding="utf-8") as settingsFile:
+                        outputs=[dict(output,outputName=os.path.join(self.directory,output["outputName"])) if "outputName" in output else output for output in json.load(settingsFile)]
+                except Exception as ex:
+                    print("Could not read {0}: {1}".format(settingsName,ex))
+                    continue
+            names=set()
+            for output in outputs:
+                written+=self.render(feedName,output)
+                names.add(os.path.basename(output.get("outputName",self.feeds[feedName][0].outputName)))
+            self.dropPages(feedName,names)
+        for feedName in set(self.feeds)-set(seen):
+            del self.feeds[feedName]
+        for feedName in set(self.pageNames)-set(seen):
+            self.dropPages(feedName,set())
+        return written
+    def dropPages(self,feedName,names):
+        """keep only pages in names (filenames without directory) of the outputs of a feed, and remember them as its outputs. pages that another feed also writes are kept."""
+        others=set().union(*(pages for otherFeed,pages in self.pageNames.items() if otherFeed!=feedName))
+        for name in self.pageNames.pop(feedName,set())-names-others:
+            self.pages.pop(name,None)
+        if names:
+            self.pageNames[feedName]=names
+    def render(self,feedName,output):
+        """write an output of a feed that has been read, and keep it in self.pages. return 1 if it was written, 0 if not."""
+        gtfs,model=self.feeds[feedName]
+        start=time.perf_counter()
+        log=io.StringIO()
+        try:
+            with contextlib.redirect_stdout(log):
+                render=_renderOutput(gtfs,model,output,self.options)
+            with open(render.outputName,"rb") as page:
+                body=page.read()
+        except (SystemExit,Exception) as ex:
+            print("Could not write {0}: {1}".format(output.get("outputName",gtfs.outputName),log.getvalue().strip() or ex))
+            return 0
+        lastModified=email.utils.parsedate_to_datetime(render.outputVars["generationDate"]).timestamp()
+        self.pages[os.path.basename(render.outputName)]=(body,gzip.compress(body,mtime=0),'"{0}"'.format(hashlib.sha1(body).hexdigest()[:20]),int(lastModified))
+        print("Wrote {0} ({1} routes) in {2:.1f}s".format(render.outputName,len(render.routes),time.perf_counter()-start))
+        return 1
+    def run(self,interval=2.0):
+        """poll forever, every interval seconds"""
+        while True:
+            self.poll()
+            time.sleep(interval)
+class WatchRequestHandler(http.server.BaseHTTPRequestHandler):
+    """serve the pages of a FeedWatcher (as self.server.watcher) from memory. pages have an ETag and Last-Modified (from generationDate), so browsers only get them again when they change, and are sent gzipped if the browser accepts it."""
+    def do_GET(self):
+        self.respond(True)
+    def do_HEAD(self):
+        self.respond(False)
+    def respond(self,withBody):
+        """send a page (or list of pages for /), or 304 if the browser has it already"""
+        pages=self.server.watcher.pages
+        name=urllib.parse.unquote(urllib.parse.urlsplit(self.path).path.lstrip("/"))
+        if ""==name:
+            body="".join("<li><a href='{0}'>{1}</a></li>".format(urllib.parse.quote(page),html.escape(page)) for page in sorted(pages))
+            body="<!DOCTYPE html><html><head><meta charset='UTF-8'/><title>t-time</title></head><body><ul>{0}</ul></body></html>".format(body).encode("utf-8")
+            self.send(200,body,{},withBody)
+            return
+        if name not in pages:
+            self.send_error(404)
+            return
+        body,gzipped,etag,lastModified=pages[name]
+        useGzip=self.acceptsGzip()
+        if useGzip:
+            etag=etag[:-1]+'-gzip"'
+        headers={"ETag":etag,"Last-Modified":email.utils.formatdate(lastModified,usegmt=True),"Vary":"Accept-Encoding","Cache-Control":"no-cache"}
+        if self.notModified(etag,lastModified):
+            self.send(304,b"",headers,False)
+            return
+        if useGzip:
+            headers["Content-Encoding"]="gzip"
+            body=gzipped
+        self.send(200,body,headers,withBody)
+    def acceptsGzip(self):
+        """does the browser accept gzip, by Accept-Encoding? codings (or *) with q=0 are not accepted."""
+        accepted={}
+        for coding in self.headers.get("Accept-Encoding","").split(","):
+            name,*params=(part.strip() for part in coding.split(";"))
+            quality=1.0
+            for param in params:
+                if param.lower().startswith("q="):
+                    try:
+                        quality=float(param[2:])
+                    except ValueError:
+                        quality=0.0
+            accepted[name.lower()]=quality
+        return 0<accepted.get("gzip",accepted.get("x-gzip",accepted.get("*",0.0)))
+    def notModified(self,etag,lastModified):
+        """does the browser have this version of a page, by If-None-Match (or If-Modified-Since, if that isn't given)?"""
+        if "If-None-Match" in self.headers:
+            return etag in (tag.strip() for tag in self.headers["If-None-Match"].split(",")) or "*"==self.headers["If-None-Match"].strip()
+        if "If-Modified-Since" in self.headers:
+            try:
+                return lastModified<=email.utils.parsedate_to_datetime(self.headers["If-Modified-Since"]).timestamp()
+            except (TypeError,ValueError):
+                return False
+        return False
+    def send(self,status,body,headers,withBody):
+        """send a response with body (bytes) as HTML"""
+        self.send_response(status)
+        self.send_header("Content-Type","text/html; charset=utf-8")
+        for header,value in headers.items():
+            self.send_header(header,value)
+        if 304!=status:
+            self.send_header("Content-Length",str(len(body)))
+        self.end_headers()
+        if withBody:
+            self.wfile.write(body)
+def _positiveInt(value):
+    """argparse type for a whole number more than 0"""
+    try:
+        number=int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError("{0} is not a whole number".format(value))
+    if number<1:
+        raise argparse.ArgumentTypeError("{0} is not more than 0".format(value))
+    return number
+def main(args):
+    """command line entry point. args are like argv, without the program name"""
+    parser=argparse.ArgumentParser(prog="t-time.py",description="Write a static HTML time table from a GTFS feed. Selections are read from the last output, if there is one.")
+    parser.add_argument("feed",nargs="?",help="GTFS zip file (default: read feed files from current directory)")
+    parser.add_argument("--batch",metavar="MANIFEST",help="write outputs for many feeds listed in a JSON file (see runBatch), instead of one feed")
+    parser.add_argument("--jobs",type=_positiveInt,help="how many feeds to process at once with --batch (default: number of CPUs)")
+    parser.add_argument("--watch",metavar="DIRECTORY",help="keep feeds (zips) in a directory read, and write their outputs when they or their settings (like PAAC.json for PAAC.zip, see FeedWatcher) change, until stopped")
+    parser.add_argument("--interval",type=float,default=2.0,help="seconds between looking for changes with --watch (default: 2)")
+    parser.add_argument("--port",type=int,help="with --watch, also serve outputs over HTTP on this port")
+    parser.add_argument("--host",default="127.0.0.1",help="address to serve outputs on with --port (default: 127.0.0.1)")
+    parser.add_argument("--no-cache",action="store_true",help="don't read or write the parsed feed cache next to the zip (--watch never does)")
+    parser.add_argument("--clear-cache",action="store_true",help="delete the parsed feed cache first, so the feed is read again")
+    parser.add_argument("--incremental",action="store_true",help="reuse output of routes that did not change since the last output")
+    parser.add_argument("--report",metavar="FILE",help="write time, memory, and counts of rows, trips, stops, and output bytes for each step to a JSON file")
+    parser.add_argument("--profile",metavar="FILE",help="profile the run with cProfile, and write stats to a file (for pstats or snakeviz)")
+    parser.add_argument("--days",type=_positiveInt,help="only keep services that run in this many days (from --start), and leave other dates to the weekday schedules")
+    parser.add_argument("--start",type=datetime.date.fromisoformat,help="first day for --days, like 2026-12-24 (default: today)")
+    parser.add_argument("--next",metavar="STOP",help="instead of writing an output, list the next departures from a stop (by ID or name) in the feed")
+    parser.add_argument("--route",help="with --next, only list departures of this route (by ID or {0})".format(_routeIdColumn))
+    parser.add_argument("--at",type=datetime.datetime.fromisoformat,help="with --next, list departures from this time, like 2026-12-24T13:05 (default: now)")
+    parser.add_argument("--count",type=_positiveInt,default=5,help="how many departures to list with --next (default: 5)")
+    parser.add_argument("--minify",action="store_true",help="minify the script and CSS in the output, and drop CSS rules that nothing uses")
+    parser.add_argument("--lazy-routes",choices=_routeEncodings,help="write each route's data separately, to be decoded only when the route is shown (gzip is smaller, but needs a browser with DecompressionStream)")
+    options=parser.parse_args(args)
+    dateWindow=None
+    if options.start is not None and options.days is None:
+        parser.error("--start needs --days")
+    if options.days is not None:
+        dateWindow=(options.start or datetime.date.today(),options.days)
+    if options.batch is not None:
+        if options.feed is not None:
+            parser.error("a feed can't be given with --batch, list it in the manifest")
+        exit(runBatch(options.batch,options.jobs,not options.no_cache,options.incremental,options.lazy_routes,options.minify,dateWindow))
+    if options.watch is not None:
+        if options.feed is not None:
+            parser.error("a feed can't be given with --watch, put it in the directory")
+        watcher=FeedWatcher(options.watch,options.incremental,options.lazy_routes,options.minify,dateWindow)
+        if options.port is not None:
+            server=http.server.ThreadingHTTPServer((options.host,options.port),WatchRequestHandler)
+            server.watcher=watcher
+            threading.Thread(target=server.serve_forever,daemon=True).start()
+            print("Serving outputs at http://{0}:{1}/".format(*server.server_address[:2]))
+        try:
+            watcher.run(options.interval)
+        except KeyboardInterrupt:
+            return
+    if options.next is not None:
+        if options.feed is None:
+            parser.error("--next needs a feed")
+        # departures are the only output, for other programs to read
+        with contextlib.redirect_stdout(sys.stderr):
+            index=loadDepartureIndex(options.feed,not options.no_cache)
+        if options.next not in index.stopIds:
+            parser.error("there is no stop {0} in {1}".format(options.next,options.feed))
+        if options.route is not None and options.route not in index.routeIds:
+            parser.error("there is no route {0} in {1}".format(options.route,options.feed))
+        for when,route,direction,trip in index.nextDepartures(options.next,options.route,options.at,options.count):
+            print("{0:%Y-%m-%d %H:%M} {1} {2}".format(when,route,direction))
+        return
+    gtfs=GtfsProcessor()
+    gtfs.routeEncoding=options.lazy_routes
+    gtfs.minify=options.minify
+    gtfs.dateWindow=dateWindow
+    gtfs.useCache=not options.no_cache
+    gtfs.incremental=options.incremental
+    if options.report is not None:
+        gtfs.report=RunReport()
+    profiler=None if options.profile is None else cProfile.Profile()
+    if options.feed is None:
+        _profiledRun(gtfs,None,profiler)
+    else:
+        with zipfile.ZipFile(options.feed) as inputZipObject:
+            if options.clear_cache and gtfs.clearCache(inputZipObject) is not None:
+                print("Deleted cache {0}".format(gtfs.cacheName(inputZipObject)))
+            _profiledRun(gtfs,inputZipObject,profiler)
+    if profiler is not None:
+        profiler.dump_stats(options.profile)
+        print("Wrote profile {0}".format(options.profile))
+    if gtfs.report is not None:
+        gtfs.report.write(options.report)
+        print("Wrote report {0}".format(options.report))
+def _profiledRun(gtfs,inputZip,profiler):
+    """gtfs.run(inputZip), with profiler (a cProfile.Profile) on, if there is one"""
+    if profiler is None:
+        gtfs.run(inputZip)
     else:
-        GtfsProcessor().run()
+        profiler.runcall(gtfs.run,inputZip)
+
+if "__main__"==__name__:
+    main(argv[1:])